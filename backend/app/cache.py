@@ -1,14 +1,208 @@
+import gzip
 import json
 import os
-from datetime import datetime, timedelta
+import threading
+import time
+from collections import OrderedDict
 import urllib.parse
 
-import boto3
-import pytz
+import clients
 from environment import environment
 
-s3 = boto3.client("s3")
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+s3 = clients.lazy_client("s3")
 CACHE_TTL = int(os.environ.get("CACHE_TTL", "60"))  # e.g., cache for 1 hour
+CACHE_MAX_STALE = int(os.environ.get("CACHE_MAX_STALE", "86400"))
+LEASE_TTL = int(os.environ.get("CACHE_LEASE_TTL", "30"))
+GENERATION_KEY = "progress:generation"
+GENERATION_TTL = int(os.environ.get("CACHE_GENERATION_TTL", "3600"))
+GENERATION_CHECK_INTERVAL = int(
+    os.environ.get("CACHE_GENERATION_CHECK_INTERVAL", "15")
+)
+CACHE_SERIALIZER = os.environ.get("CACHE_SERIALIZER", "columnar+gzip")
+MEMORY_CACHE_MAX_ENTRIES = int(
+    os.environ.get("MEMORY_CACHE_MAX_ENTRIES", "128")
+)
+MEMORY_CACHE_MAX_BYTES = int(
+    os.environ.get("MEMORY_CACHE_MAX_BYTES", str(16 * 1024 * 1024))
+)
+
+
+class MemoryCache:
+    """
+    In-process LRU cache that lives as long as the Lambda container.
+    Entries expire after their TTL and the least recently used entries are
+    evicted once either the entry count or the total payload size is exceeded.
+    Responses are kept serialized, as stored in S3, so that the size counted
+    is the memory they actually take; they are decoded on each hit.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.entries: OrderedDict[str, tuple[float, int, object]] = (
+            OrderedDict()
+        )
+        self.lock = threading.Lock()
+
+    def get(self, key: str) -> object | None:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires_at, _, data = entry
+            if expires_at <= time.time():
+                self._remove(key)
+                return None
+            self.entries.move_to_end(key)
+            return data
+
+    def put(
+        self, key: str, data: object, expires_at: float, size: int
+    ) -> None:
+        if size > self.max_bytes or expires_at <= time.time():
+            return
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (expires_at, size, data)
+            self.total_bytes += size
+            while (
+                len(self.entries) > self.max_entries
+                or self.total_bytes > self.max_bytes
+            ):
+                self._remove(next(iter(self.entries)))
+
+    def _remove(self, key: str) -> None:
+        _, size, _ = self.entries.pop(key)
+        self.total_bytes -= size
+
+
+memory_cache = MemoryCache(MEMORY_CACHE_MAX_ENTRIES, MEMORY_CACHE_MAX_BYTES)
+
+
+def to_columnar(data: dict) -> dict:
+    """
+    Converts the `data` field of a progress response, shaped as
+    `{timestamp: {username: {field: int}}}`, into a columnar layout where
+    usernames and fields are listed once and each timestamp holds a flat
+    integer array (`None` for users missing at that timestamp).
+    Responses of any other shape are returned unchanged.
+    """
+    series = data.get("data")
+    if not isinstance(series, dict) or not series:
+        return data
+    usernames = {}
+    fields = None
+    for records in series.values():
+        if not isinstance(records, dict):
+            return data
+        for username, record in records.items():
+            if not isinstance(record, dict):
+                return data
+            if fields is None:
+                fields = list(record.keys())
+            elif list(record.keys()) != fields:
+                return data
+            usernames.setdefault(username, None)
+    if fields is None:
+        return data
+    usernames = list(usernames)
+    values = []
+    for records in series.values():
+        row = []
+        for username in usernames:
+            record = records.get(username)
+            if record is None:
+                row.extend([None] * len(fields))
+            else:
+                row.extend(record.values())
+        values.append(row)
+    columnar = {key: value for key, value in data.items() if key != "data"}
+    columnar["data"] = {
+        # JSON object keys are strings, so store timestamps the same way
+        "timestamps": [str(ts) for ts in series.keys()],
+        "usernames": usernames,
+        "fields": fields,
+        "values": values,
+    }
+    return columnar
+
+
+def from_columnar(columnar: dict) -> dict:
+    series = columnar["data"]
+    fields = series["fields"]
+    width = len(fields)
+    data = {}
+    for ts, row in zip(series["timestamps"], series["values"]):
+        records = {}
+        for i, username in enumerate(series["usernames"]):
+            values = row[i * width : (i + 1) * width]
+            if values[0] is not None:
+                records[username] = dict(zip(fields, values))
+        data[ts] = records
+    response = {key: value for key, value in columnar.items() if key != "data"}
+    response["data"] = data
+    return response
+
+
+# Layouts map a response to a JSON-serializable document and back
+LAYOUTS = {
+    "json": (lambda data: data, lambda data: data),
+    "columnar": (to_columnar, from_columnar),
+}
+
+# Codecs compress the JSON document, keyed by their Content-Encoding
+CODECS = {
+    "identity": (lambda body: body, lambda body: body),
+    "gzip": (gzip.compress, gzip.decompress),
+}
+if zstandard is not None:
+    CODECS["zstd"] = (
+        lambda body: zstandard.ZstdCompressor().compress(body),
+        lambda body: zstandard.ZstdDecompressor().decompress(body),
+    )
+
+
+def serialize(data: dict, serializer: str = CACHE_SERIALIZER) -> tuple:
+    """
+    Serializes the data with a `<layout>+<codec>` serializer, e.g.
+    `columnar+gzip`. Falls back to gzip when the codec is not available.
+
+    Returns:
+        tuple: The body, the layout, the codec and the uncompressed size.
+    """
+    layout, _, codec = serializer.partition("+")
+    codec = codec or "identity"
+    if codec not in CODECS:
+        codec = "gzip"
+    document = LAYOUTS[layout][0](data)
+    if document is data:
+        layout = "json"
+    raw = json.dumps(document, separators=(",", ":")).encode("utf-8")
+    return CODECS[codec][0](raw), layout, codec, len(raw)
+
+
+def deserialize(body: bytes, layout: str, codec: str) -> dict:
+    """Reverses `serialize`."""
+    raw = CODECS[codec][1](body)
+    return LAYOUTS[layout][1](json.loads(raw.decode("utf-8")))
+
+
+stats = {
+    "memory": {"hit": 0, "miss": 0},
+    "s3": {"hit": 0, "stale": 0, "miss": 0},
+}
+
+
+def get_stats() -> dict:
+    """Returns the hit/miss counters of each cache tier for this container."""
+    return {tier: dict(counters) for tier, counters in stats.items()}
 
 
 def encode_cache_key(key: str) -> str:
@@ -19,42 +213,243 @@ def encode_cache_key(key: str) -> str:
     return urllib.parse.quote_plus(key, safe="")
 
 
-def is_cache_fresh(cache_key: str, ttl: int = CACHE_TTL) -> bool:
-    cache_key = encode_cache_key(cache_key)
+def get_entry(
+    cache_key: str, ttl: int = CACHE_TTL, max_stale: int = CACHE_MAX_STALE
+) -> tuple[dict | None, bool]:
+    """
+    Returns the cached data together with whether it is still fresh.
+    Entries older than `ttl` are returned as stale for up to `max_stale`
+    seconds. The write time is stored in the object metadata, so a single
+    GET is enough to decide freshness.
+    """
     if not environment.production:
-        return False
+        return None, False
+    serialized = memory_cache.get(cache_key)
+    if serialized is not None:
+        stats["memory"]["hit"] += 1
+        return deserialize(*serialized), True
+    stats["memory"]["miss"] += 1
     try:
-        tz = pytz.timezone("UTC")
-        metadata = s3.head_object(
-            Bucket=environment.cache_bucket_name, Key=cache_key
+        cached_data = s3.get_object(
+            Bucket=environment.cache_bucket_name,
+            Key=encode_cache_key(cache_key),
         )
-        last_modified = metadata["LastModified"]
-        age = datetime.now(tz=tz) - last_modified.replace(tzinfo=tz)
-        return age < timedelta(seconds=ttl)
     except Exception:
-        return False
+        stats["s3"]["miss"] += 1
+        return None, False
+    metadata = cached_data.get("Metadata", {})
+    if "written-at" in metadata:
+        written_at = float(metadata["written-at"])
+    else:
+        # Objects written before the metadata was introduced
+        written_at = cached_data["LastModified"].timestamp()
+    expires_at = written_at + ttl
+    now = time.time()
+    if expires_at + max_stale <= now:
+        stats["s3"]["miss"] += 1
+        return None, False
+    serialized = (
+        cached_data["Body"].read(),
+        metadata.get("layout", "json"),
+        cached_data.get("ContentEncoding") or "identity",
+    )
+    try:
+        data = deserialize(*serialized)
+    except Exception:
+        stats["s3"]["miss"] += 1
+        return None, False
+    if expires_at <= now:
+        stats["s3"]["stale"] += 1
+        return data, False
+    stats["s3"]["hit"] += 1
+    # Keep the entry in memory for the rest of its lifetime
+    memory_cache.put(cache_key, serialized, expires_at, len(serialized[0]))
+    return data, True
+
 
+def get_fresh(cache_key: str, ttl: int = CACHE_TTL) -> dict | None:
+    """Returns the cached data if it was written less than `ttl` seconds ago."""
+    data, is_fresh = get_entry(cache_key, ttl, max_stale=0)
+    return data if is_fresh else None
 
-def get_cache(cache_key: str) -> dict | None:
-    cache_key = encode_cache_key(cache_key)
+
+def get_encoded(
+    cache_key: str, encodings: list[str], ttl: int = CACHE_TTL
+) -> tuple[tuple[bytes, str] | None, bool]:
+    """
+    Returns the body of a fresh entry without decoding it, together with its
+    Content-Encoding, so that it can be sent to the client as is. Only plain
+    JSON entries (see `put_cache` with a `json+<codec>` serializer)
+    compressed with one of `encodings` are returned.
+
+    Returns:
+        tuple: The body and its Content-Encoding, or `None`, and whether the
+            entry exists at all, fresh or not.
+    """
     if not environment.production:
-        return
+        return None, False
+    serialized = memory_cache.get(cache_key)
+    if serialized is not None:
+        stats["memory"]["hit"] += 1
+        body, layout, codec = serialized
+        if layout != "json" or codec not in encodings:
+            return None, True
+        return (body, codec), True
+    stats["memory"]["miss"] += 1
     try:
         cached_data = s3.get_object(
-            Bucket=environment.cache_bucket_name, Key=cache_key
+            Bucket=environment.cache_bucket_name,
+            Key=encode_cache_key(cache_key),
         )
-        return json.loads(cached_data["Body"].read().decode("utf-8"))
     except Exception:
+        stats["s3"]["miss"] += 1
+        return None, False
+    metadata = cached_data.get("Metadata", {})
+    codec = cached_data.get("ContentEncoding") or "identity"
+    if "written-at" not in metadata or metadata.get("layout") != "json":
+        stats["s3"]["miss"] += 1
+        return None, True
+    expires_at = float(metadata["written-at"]) + ttl
+    if expires_at <= time.time():
+        stats["s3"]["miss"] += 1
+        return None, True
+    stats["s3"]["hit"] += 1
+    body = cached_data["Body"].read()
+    # Shared with `get_entry`, which decodes the same body
+    memory_cache.put(cache_key, (body, "json", codec), expires_at, len(body))
+    return ((body, codec) if codec in encodings else None), True
+
+
+def get_generation() -> dict | None:
+    """
+    Returns the data generation marker published by the scraper after each
+    scrape, e.g. `{"generation": 1746776519, "previous": 1746775319}`.
+    The marker is re-read from S3 at most every GENERATION_CHECK_INTERVAL
+    seconds.
+    """
+    if not environment.production:
         return None
+    marker = memory_cache.get(GENERATION_KEY)
+    if marker is not None:
+        return marker
+    try:
+        response = s3.get_object(
+            Bucket=environment.cache_bucket_name,
+            Key=encode_cache_key(GENERATION_KEY),
+        )
+        marker = json.loads(response["Body"].read().decode("utf-8"))
+    except Exception as e:
+        print(f"Error fetching data generation: {e}")
+        return None
+    set_generation(marker)
+    return marker
+
+
+def set_generation(marker: dict) -> None:
+    """Overrides the generation marker known by this container."""
+    memory_cache.put(
+        GENERATION_KEY, marker, time.time() + GENERATION_CHECK_INTERVAL, 0
+    )
+
+
+def versioned_key(
+    cache_key: str, ttl: int = CACHE_TTL
+) -> tuple[str, str | None, int]:
+    """
+    Ties a cache key to the current data generation, so that entries stay
+    valid until the next scrape instead of expiring after a fixed TTL.
+
+    Returns:
+        tuple: The versioned key, the key of the previous generation (to be
+            served as stale while the new one is computed) and the TTL to use.
+            Without a generation marker, the key and `ttl` are returned as is.
+    """
+    marker = get_generation()
+    if not marker:
+        return cache_key, None, ttl
+    previous_key = None
+    if marker.get("previous"):
+        previous_key = f"{cache_key}:{marker['previous']}"
+    return f"{cache_key}:{marker['generation']}", previous_key, GENERATION_TTL
+
+
+def acquire_lease(cache_key: str, lease_ttl: int = LEASE_TTL) -> bool:
+    """
+    Tries to take the refresh lease of a cache entry, so that only one Lambda
+    recomputes it. The lease is an S3 object created with a conditional put;
+    a lease older than `lease_ttl` is considered abandoned and taken over.
+    """
+    if not environment.production:
+        return True
+    lease_key = encode_cache_key(f"lease:{cache_key}")
+    for _ in range(2):
+        try:
+            s3.put_object(
+                Bucket=environment.cache_bucket_name,
+                Key=lease_key,
+                Body=b"",
+                IfNoneMatch="*",
+            )
+            return True
+        except s3.exceptions.ClientError as e:
+            code = e.response.get("Error", {}).get("Code")
+            if code not in (
+                "PreconditionFailed",
+                "ConditionalRequestConflict",
+            ):
+                print(f"Error acquiring lease for {cache_key}: {e}")
+                return False
+        try:
+            metadata = s3.head_object(
+                Bucket=environment.cache_bucket_name, Key=lease_key
+            )
+        except Exception:
+            # The lease was released in the meantime, try again
+            continue
+        age = time.time() - metadata["LastModified"].timestamp()
+        if age < lease_ttl:
+            return False
+        release_lease(cache_key)
+    return False
 
 
-def put_cache(cache_key: str, data: dict) -> None:
-    cache_key = encode_cache_key(cache_key)
+def release_lease(cache_key: str) -> None:
     if not environment.production:
         return
+    try:
+        s3.delete_object(
+            Bucket=environment.cache_bucket_name,
+            Key=encode_cache_key(f"lease:{cache_key}"),
+        )
+    except Exception as e:
+        print(f"Error releasing lease for {cache_key}: {e}")
+
+
+def put_cache(
+    cache_key: str,
+    data: dict,
+    ttl: int = CACHE_TTL,
+    serializer: str = CACHE_SERIALIZER,
+) -> None:
+    if not environment.production:
+        return
+    written_at = time.time()
+    body, layout, codec, _ = serialize(data, serializer)
+    memory_cache.put(
+        cache_key, (body, layout, codec), written_at + ttl, len(body)
+    )
+    extra_args = {}
+    if codec != "identity":
+        extra_args["ContentEncoding"] = codec
     s3.put_object(
         Bucket=environment.cache_bucket_name,
-        Key=cache_key,
-        Body=json.dumps(data),
+        Key=encode_cache_key(cache_key),
+        Body=body,
         ContentType="application/json",
+        Metadata={
+            "written-at": str(written_at),
+            "ttl": str(ttl),
+            "layout": layout,
+        },
+        **extra_args,
     )
@@ -0,0 +1,100 @@
+import os
+import threading
+
+import boto3
+from botocore.config import Config
+from dynamo import SCAN_SEGMENTS
+from environment import environment
+
+# Enough connections for every thread of the parallel fetch and scan paths,
+# plus a few for the cache and user lookups running next to them
+MAX_POOL_CONNECTIONS = int(
+    os.environ.get(
+        "MAX_POOL_CONNECTIONS",
+        str(max(environment.fetch_concurrency, SCAN_SEGMENTS) + 4),
+    )
+)
+
+config = Config(
+    max_pool_connections=MAX_POOL_CONNECTIONS,
+    tcp_keepalive=True,
+    connect_timeout=float(os.environ.get("AWS_CONNECT_TIMEOUT", "2")),
+    read_timeout=float(os.environ.get("AWS_READ_TIMEOUT", "5")),
+    retries={
+        "mode": "standard",
+        "max_attempts": int(os.environ.get("AWS_MAX_ATTEMPTS", "4")),
+    },
+)
+
+
+class Lazy:
+    """
+    Proxy that builds the wrapped object on first attribute access, so that
+    boto3 clients and resources are only created when a request needs them
+    instead of during the Lambda cold start.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._value = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self._value is None:
+            with self._lock:
+                if self._value is None:
+                    self._value = self._factory()
+        return self._value
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+
+_lock = threading.Lock()
+_session = None
+_clients = {}
+_resources = {}
+
+
+def session() -> boto3.session.Session:
+    """Returns the boto3 session shared by every client of the container."""
+    global _session
+    if _session is None:
+        _session = boto3.session.Session()
+    return _session
+
+
+def client(service_name: str):
+    """
+    Returns the boto3 client of the service. Clients are created once per
+    container and reused across warm invocations, keeping their connections
+    alive between requests.
+    """
+    with _lock:
+        if service_name not in _clients:
+            _clients[service_name] = session().client(
+                service_name, config=config
+            )
+        return _clients[service_name]
+
+
+def resource(service_name: str):
+    """Returns the boto3 resource of the service, shared by the container."""
+    with _lock:
+        if service_name not in _resources:
+            _resources[service_name] = session().resource(
+                service_name, config=config
+            )
+        return _resources[service_name]
+
+
+def lazy_client(service_name: str) -> Lazy:
+    return Lazy(lambda: client(service_name))
+
+
+def lazy_resource(service_name: str) -> Lazy:
+    return Lazy(lambda: resource(service_name))
+
+
+def lazy_table(table_name: str) -> Lazy:
+    return Lazy(lambda: resource("dynamodb").Table(table_name))
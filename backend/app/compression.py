@@ -0,0 +1,92 @@
+import gzip
+import os
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", "1024"))
+
+# Encoders by Content-Encoding, in order of preference
+ENCODERS = {}
+if brotli is not None:
+    ENCODERS["br"] = lambda body: brotli.compress(body, quality=5)
+ENCODERS["gzip"] = lambda body: gzip.compress(body, compresslevel=6)
+
+
+def accepted_encodings(accept_encoding: str | None) -> list[str]:
+    """
+    Returns the supported encodings accepted by the client, in order of
+    preference, from the value of its Accept-Encoding header.
+    """
+    accepted = set()
+    for coding in (accept_encoding or "").split(","):
+        name, _, params = coding.strip().partition(";")
+        quality = params.strip()
+        if quality.startswith("q="):
+            try:
+                if float(quality[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(name.strip().lower())
+    if "*" in accepted:
+        return list(ENCODERS)
+    return [encoding for encoding in ENCODERS if encoding in accepted]
+
+
+class CompressionMiddleware:
+    """
+    Compresses the responses larger than `minimum_size` with the preferred
+    encoding accepted by the client. Responses that already have a
+    Content-Encoding, e.g. compressed cache entries, are sent as is.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encodings = accepted_encodings(
+            Headers(scope=scope).get("accept-encoding")
+        )
+        if not encodings:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        chunks = []
+
+        async def send_compressed(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+
+            # The JSON responses are small enough to be buffered
+            body = b"".join(chunks)
+            headers = MutableHeaders(raw=start_message["headers"])
+            if "content-encoding" in headers:
+                headers.add_vary_header("Accept-Encoding")
+            elif len(body) >= self.minimum_size:
+                encoding = encodings[0]
+                body = ENCODERS[encoding](body)
+                headers["Content-Encoding"] = encoding
+                headers["Content-Length"] = str(len(body))
+                headers.add_vary_header("Accept-Encoding")
+            await send(start_message)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_compressed)
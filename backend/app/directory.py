@@ -0,0 +1,69 @@
+import os
+import threading
+import time
+
+import clients
+from dynamo import parallel_scan
+from environment import environment
+
+DIRECTORY_TTL = int(os.environ.get("DIRECTORY_TTL", "60"))
+
+
+class UserDirectory:
+    """
+    Directory of the users table, memoized per Lambda container.
+    The table is read with a parallel scan that only projects the
+    attributes needed to list users, and re-read after `ttl` seconds.
+    """
+
+    projection = (
+        "username, preferred_username, leetcode_username, first_timestamp"
+    )
+
+    def __init__(self, table, ttl: int):
+        self.table = table
+        self.ttl = ttl
+        self.items: list[dict] | None = None
+        self.expires_at = 0.0
+        self.lock = threading.Lock()
+
+    def get_items(self) -> list[dict]:
+        with self.lock:
+            if self.items is None or self.expires_at <= time.time():
+                self.items = self.scan()
+                self.expires_at = time.time() + self.ttl
+            return self.items
+
+    def scan(self) -> list[dict]:
+        return list(
+            parallel_scan(self.table, ProjectionExpression=self.projection)
+        )
+
+    def invalidate(self) -> None:
+        with self.lock:
+            self.items = None
+
+    def get_first_timestamps(self) -> dict[str, int | None]:
+        """Maps each LeetCode username to the first time it was scraped."""
+        return collect_first_timestamps(self.get_items())
+
+
+def collect_first_timestamps(user_items: list[dict]) -> dict[str, int | None]:
+    """Maps each LeetCode username to the first time it was scraped, sorted by username."""
+    first_timestamps = {}
+    for item in user_items:
+        if "leetcode_username" not in item:
+            continue
+        first_timestamp = item.get("first_timestamp")
+        if first_timestamp is not None:
+            first_timestamp = int(first_timestamp)
+            previous = first_timestamps.get(item["leetcode_username"])
+            if previous is not None:
+                first_timestamp = min(first_timestamp, previous)
+        first_timestamps[item["leetcode_username"]] = first_timestamp
+    return dict(sorted(first_timestamps.items()))
+
+
+users_directory = UserDirectory(
+    clients.lazy_table(environment.users_table_name), DIRECTORY_TTL
+)
@@ -0,0 +1,195 @@
+import os
+import queue
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator
+
+SCAN_SEGMENTS = int(os.environ.get("SCAN_SEGMENTS", "4"))
+BATCH_GET_SIZE = 100  # BatchGetItem limit
+BATCH_GET_MAX_RETRIES = int(os.environ.get("BATCH_GET_MAX_RETRIES", "8"))
+BATCH_GET_BACKOFF_BASE = 0.05
+BATCH_GET_BACKOFF_MAX = 2.0
+
+_SEGMENT_DONE = object()
+
+
+def scan_segment(
+    table,
+    segment: int | None = None,
+    total_segments: int | None = None,
+    **scan_kwargs,
+) -> Iterator[list[dict]]:
+    """Scans one segment of a table (or the whole table), yielding each page of items."""
+    if total_segments is not None:
+        scan_kwargs["Segment"] = segment
+        scan_kwargs["TotalSegments"] = total_segments
+    # The segments run in their own threads, which may share the client of
+    # the table but not the resource itself
+    client = table.meta.client
+    scan_kwargs["TableName"] = table.name
+    while True:
+        response = client.scan(**scan_kwargs)
+        yield response.get("Items", [])
+        if "LastEvaluatedKey" not in response:
+            break
+        scan_kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+
+def parallel_scan(
+    table, total_segments: int = SCAN_SEGMENTS, **scan_kwargs
+) -> Iterator[dict]:
+    """
+    Scans a table with DynamoDB parallel scan, one thread per segment, and
+    yields the items as their pages arrive. At most a few pages are buffered,
+    so the whole table is never held in memory by the scan itself.
+
+    Args:
+        table: The boto3 DynamoDB table resource.
+        total_segments (int): The number of segments scanned concurrently.
+        **scan_kwargs: Extra arguments of the scan, e.g. ProjectionExpression.
+    """
+    if total_segments <= 1:
+        for items in scan_segment(table, **scan_kwargs):
+            yield from items
+        return
+
+    pages = queue.Queue(maxsize=total_segments * 2)
+    stop = threading.Event()
+
+    def put(page) -> None:
+        while not stop.is_set():
+            try:
+                pages.put(page, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def scan(segment: int) -> None:
+        try:
+            for items in scan_segment(
+                table, segment, total_segments, **dict(scan_kwargs)
+            ):
+                if stop.is_set():
+                    return
+                put(items)
+        except Exception as e:
+            put(e)
+        finally:
+            put(_SEGMENT_DONE)
+
+    with ThreadPoolExecutor(max_workers=total_segments) as executor:
+        for segment in range(total_segments):
+            executor.submit(scan, segment)
+        try:
+            remaining = total_segments
+            while remaining:
+                page = pages.get()
+                if page is _SEGMENT_DONE:
+                    remaining -= 1
+                elif isinstance(page, Exception):
+                    raise page
+                else:
+                    yield from page
+        finally:
+            # Let the segments still running exit if the caller stops early
+            stop.set()
+
+
+def batch_get_chunk(
+    client, table_name: str, keys: list[dict], **request_kwargs
+) -> tuple[list[dict], int, float]:
+    """
+    Reads up to BATCH_GET_SIZE keys, retrying the unprocessed keys with
+    jittered exponential backoff.
+
+    Returns:
+        tuple: The items, the number of retries and the consumed capacity.
+    """
+    request_items = {table_name: {"Keys": keys, **request_kwargs}}
+    items = []
+    retries = 0
+    consumed_capacity = 0.0
+    while True:
+        response = client.batch_get_item(
+            RequestItems=request_items, ReturnConsumedCapacity="TOTAL"
+        )
+        items.extend(response.get("Responses", {}).get(table_name, []))
+        consumed_capacity += sum(
+            capacity.get("CapacityUnits", 0)
+            for capacity in response.get("ConsumedCapacity", [])
+        )
+        request_items = response.get("UnprocessedKeys")
+        if not request_items:
+            return items, retries, consumed_capacity
+        if retries >= BATCH_GET_MAX_RETRIES:
+            unprocessed = len(request_items[table_name]["Keys"])
+            raise RuntimeError(
+                f"{unprocessed} keys of {table_name} still unprocessed after {retries} retries"
+            )
+        # Full jitter: sleep a random time up to the exponential backoff
+        time.sleep(
+            random.uniform(
+                0,
+                min(
+                    BATCH_GET_BACKOFF_MAX,
+                    BATCH_GET_BACKOFF_BASE * 2**retries,
+                ),
+            )
+        )
+        retries += 1
+
+
+def batch_get_items(
+    client,
+    table_name: str,
+    keys: list[dict],
+    max_workers: int = 4,
+    performance: dict | None = None,
+    **request_kwargs,
+) -> list[dict]:
+    """
+    Reads items by key with BatchGetItem. The keys are deduplicated and split
+    into chunks of BATCH_GET_SIZE, which are read concurrently; unprocessed
+    keys are retried until every item is read, or an error is raised.
+
+    Args:
+        client: The DynamoDB client, e.g. `dynamodb.meta.client` of a resource.
+        table_name (str): The name of the table.
+        keys (list[dict]): The primary keys of the items.
+        max_workers (int): The maximum number of concurrent requests.
+        performance (dict | None): If given, the number of retries and the
+            consumed capacity units are added to it.
+        **request_kwargs: Extra arguments of the table request, e.g.
+            ProjectionExpression.
+    """
+    keys = list({tuple(sorted(key.items())): key for key in keys}.values())
+    chunks = [
+        keys[i : i + BATCH_GET_SIZE]
+        for i in range(0, len(keys), BATCH_GET_SIZE)
+    ]
+    if not chunks:
+        return []
+    with ThreadPoolExecutor(
+        max_workers=min(max_workers, len(chunks))
+    ) as executor:
+        results = list(
+            executor.map(
+                lambda chunk: batch_get_chunk(
+                    client, table_name, chunk, **request_kwargs
+                ),
+                chunks,
+            )
+        )
+    items = []
+    for chunk_items, retries, consumed_capacity in results:
+        items.extend(chunk_items)
+        if performance is not None:
+            performance["batch_get_retries"] = (
+                performance.get("batch_get_retries", 0) + retries
+            )
+            performance["consumed_capacity"] = (
+                performance.get("consumed_capacity", 0) + consumed_capacity
+            )
+    return items
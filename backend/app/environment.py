@@ -18,8 +18,28 @@ class Environment:
         "CACHE_BUCKET_NAME",
         "leetcode-progress-cache-718795813953-ap-northeast-1",
     )
+    # Maximum number of concurrent DynamoDB requests per progress request
+    fetch_concurrency: int = int(os.environ.get("FETCH_CONCURRENCY", "8"))
+    # Extend the previously computed progress series instead of rebuilding it
+    incremental_progress: bool = (
+        os.environ.get("INCREMENTAL_PROGRESS", "false").lower() == "true"
+    )
+    # Read interval progress from the hourly/daily rollups written by the
+    # scraper, see scripts/20261018-backfill-rollups.py for older samples
+    progress_rollups: bool = (
+        os.environ.get("PROGRESS_ROLLUPS", "false").lower() == "true"
+    )
+    # Seconds between two scrapes, used to expire the progress responses
+    scrape_interval: int = int(os.environ.get("SCRAPE_INTERVAL", "1200"))
+    # Match the scraper's DELTA_WRITES: unchanged samples are not stored, so
+    # the last sample of a user, at most HEARTBEAT_INTERVAL old, is carried
+    # over to the scrapes without one
+    delta_writes: bool = (
+        os.environ.get("DELTA_WRITES", "false").lower() == "true"
+    )
+    heartbeat_interval: int = int(
+        os.environ.get("HEARTBEAT_INTERVAL", "86400")
+    )
 
 
 environment = Environment()
-
-print(f"allowed_origins: {environment.allowed_origins}")
@@ -1,3 +1,5 @@
+import prewarm
+from compression import CompressionMiddleware
 from environment import environment
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
@@ -13,10 +15,18 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(CompressionMiddleware)
 
 # Include progress-related endpoints
 app.include_router(progress.router)
 app.include_router(user.router)
 app.include_router(announcement.router)
 
-handler = Mangum(app, lifespan="off")
+mangum_handler = Mangum(app, lifespan="off")
+
+
+def handler(event, context):
+    # The scraper invokes the function directly to prewarm the cache
+    if event.get("action") == "prewarm":
+        return prewarm.lambda_handler(event, context)
+    return mangum_handler(event, context)
@@ -0,0 +1,47 @@
+from datetime import timedelta
+from time import perf_counter
+
+import cache
+from directory import users_directory
+from routers.progress import get_latest_progress_data, get_progress_data
+
+
+def lambda_handler(event, context):
+    """
+    Recomputes and caches one of the most requested progress views, given as
+    "latest" or "hours:limit:timezone". Invoked asynchronously by the scraper
+    once a scrape has been stored, once per view so that each one fits in the
+    function timeout.
+    """
+    view = event.get("view", "latest")
+    performance = {}
+    errors = []
+
+    # Use the generation published by the scraper that sent this event
+    if event.get("generation"):
+        cache.set_generation(event["generation"])
+    # Pick up the users and first timestamps written by the scrape
+    users_directory.invalidate()
+
+    start_perf = perf_counter()
+    try:
+        if view == "latest":
+            get_latest_progress_data(refresh=True)
+        else:
+            hours, limit, timezone_str = view.split(":", 2)
+            get_progress_data(
+                timedelta(hours=int(hours)),
+                int(limit),
+                timezone_str,
+                refresh=True,
+            )
+    except Exception as e:
+        print(f"Error prewarming progress view {view}: {e}")
+        errors.append({"view": view, "error": str(e)})
+    performance[view] = perf_counter() - start_perf
+
+    return {
+        "statusCode": 200,
+        "performance": performance,
+        "errors": errors,
+    }
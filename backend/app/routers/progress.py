@@ -1,31 +1,53 @@
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from time import perf_counter
+from time import perf_counter, time
+from typing import Literal
 
-import boto3
 import cache
+import clients
 import pytz
 from boto3.dynamodb.conditions import Key
+from directory import collect_first_timestamps, users_directory
+from dynamo import batch_get_items, parallel_scan
 from environment import environment
 from authentication import get_claims
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+from compression import accepted_encodings
+from fastapi import (
+    APIRouter,
+    Depends,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    status,
+)
 from hashlib import sha256
 
 router = APIRouter()
 
-dynamodb = boto3.resource("dynamodb")
-progress_table = dynamodb.Table(environment.progress_table_name)
-users_table = dynamodb.Table(environment.users_table_name)
+# First sample of each user in every UTC hour and day, written by the scraper
+# to the progress table under "rollup#<granularity>#<username>"
+ROLLUP_GRANULARITIES = {"daily": 86400, "hourly": 3600}
+PROGRESS_COUNTERS = ("easy", "medium", "hard", "total")
+# Written by the scraper at every scrape, even when no sample changed.
+# Older scrapes are only known from the samples of the reference user.
+SCRAPE_CLOCK_KEY = "scrape#clock"
+REFERENCE_USERNAME = "dasbd72"
+# Newest buckets of an incremental series read again on every pass, as they
+# may have been read while the scraper was still writing their samples
+INCREMENTAL_REREAD_BUCKETS = 2
 
+dynamodb = clients.lazy_resource("dynamodb")
+progress_table = clients.lazy_table(environment.progress_table_name)
+users_table = clients.lazy_table(environment.users_table_name)
 
-def fetch_usernames() -> list[str]:
-    response = users_table.scan()
-    user_items = response.get("Items", [])
-    usernames = list(set([user["leetcode_username"] for user in user_items]))
-    usernames = sorted(usernames)
-    return usernames
 
+def fetch_users() -> dict[str, int | None]:
+    return users_directory.get_first_timestamps()
 
-def fetch_usernames_by_following(followed_by: str) -> list[str]:
+
+def fetch_users_by_following(followed_by: str) -> dict[str, int | None]:
     try:
         response = users_table.get_item(
             Key={"username": followed_by},
@@ -33,39 +55,39 @@ def fetch_usernames_by_following(followed_by: str) -> list[str]:
         )
         item = response.get("Item", {})
         following_list = item.get("following_list", [])
-        usernames = []
+        users = {}
         if following_list:
-            batch_request_keys = [
-                {"username": username} for username in following_list
-            ]
-            response = dynamodb.meta.client.batch_get_item(
-                RequestItems={
-                    users_table.name: {
-                        "Keys": batch_request_keys,
-                        "ProjectionExpression": "leetcode_username",
-                    }
-                }
+            user_items = batch_get_items(
+                dynamodb.meta.client,
+                users_table.name,
+                [{"username": username} for username in following_list],
+                max_workers=environment.fetch_concurrency,
+                ProjectionExpression="leetcode_username, first_timestamp",
             )
-            usernames = [
-                item["leetcode_username"]
-                for item in response["Responses"].get(users_table.name, [])
-                if "leetcode_username" in item
-            ]
-            usernames = sorted(usernames)
+            users = collect_first_timestamps(user_items)
     except Exception as e:
         print(f"Error fetching following list: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to fetch following list",
         )
-    return usernames
+    return users
+
+
+def hash_usernames(usernames: list[str]) -> str:
+    return sha256(",".join(usernames).encode("utf-8")).hexdigest()
 
 
 def fetch_timestamps(
-    username: str, time_delta: timedelta, limit: int, now: datetime
+    username: str,
+    time_delta: timedelta,
+    limit: int,
+    now: datetime,
+    start_time: int | None = None,
 ) -> list[int]:
     end_time = int(now.timestamp())
-    start_time = int((now - time_delta * limit).timestamp())
+    if start_time is None:
+        start_time = int((now - time_delta * limit).timestamp())
 
     response = progress_table.query(
         KeyConditionExpression=Key("username").eq(username)
@@ -88,7 +110,9 @@ def fetch_first_timestamp(
 ) -> int | None:
     start_time = int((now - time_delta * limit).timestamp())
 
-    response = progress_table.query(
+    # Runs in pool threads, which may share the client but not the table
+    response = progress_table.meta.client.query(
+        TableName=progress_table.name,
         KeyConditionExpression=Key("username").eq(username)
         & Key("timestamp").gte(start_time),
         ProjectionExpression="#ts",
@@ -103,69 +127,251 @@ def fetch_first_timestamp(
     return None
 
 
+def fetch_first_timestamps(
+    usernames: list[str], time_delta: timedelta, limit: int, now: datetime
+) -> dict[str, int | None]:
+    """Fetches the first timestamp of each user, running the queries concurrently."""
+    with ThreadPoolExecutor(
+        max_workers=environment.fetch_concurrency
+    ) as executor:
+        first_timestamps = executor.map(
+            lambda username: fetch_first_timestamp(
+                username, time_delta, limit, now
+            ),
+            usernames,
+        )
+        return dict(zip(usernames, first_timestamps))
+
+
+def fetch_latest_timestamp(username: str, now: datetime) -> int | None:
+    response = progress_table.query(
+        KeyConditionExpression=Key("username").eq(username)
+        & Key("timestamp").lte(int(now.timestamp())),
+        ProjectionExpression="#ts",
+        ExpressionAttributeNames={"#ts": "timestamp"},
+        # Sort by timestamp descending to get the last timestamp
+        ScanIndexForward=False,
+        Limit=1,
+    )
+    items = response.get("Items", [])
+    if items:
+        return int(items[0]["timestamp"])
+    return None
+
+
+def fetch_scrape_timestamps(
+    time_delta: timedelta,
+    limit: int,
+    now: datetime,
+    start_time: int | None = None,
+) -> list[int]:
+    """Fetches the timestamps of the scrapes in the window, sorted."""
+    return sorted(
+        set(
+            fetch_timestamps(
+                SCRAPE_CLOCK_KEY, time_delta, limit, now, start_time
+            )
+        )
+        | set(
+            fetch_timestamps(
+                REFERENCE_USERNAME, time_delta, limit, now, start_time
+            )
+        )
+    )
+
+
+def fetch_latest_scrape_timestamp(now: datetime) -> int | None:
+    timestamps = [
+        ts
+        for ts in (
+            fetch_latest_timestamp(SCRAPE_CLOCK_KEY, now),
+            fetch_latest_timestamp(REFERENCE_USERNAME, now),
+        )
+        if ts is not None
+    ]
+    return max(timestamps, default=None)
+
+
+def fetch_carried_samples(
+    username: str, timestamps: list[int]
+) -> dict[int, dict]:
+    """
+    Fetches the progress of a user at each of the timestamps in delta-write
+    mode, i.e. the last sample stored at or before each of them. Samples are
+    stored at least every HEARTBEAT_INTERVAL, so a single query from that
+    long before the first timestamp finds them all.
+    """
+    start_time = min(timestamps) - environment.heartbeat_interval
+    end_time = max(timestamps)
+    samples = []
+    query_kwargs = {
+        "TableName": progress_table.name,
+        "KeyConditionExpression": Key("username").eq(username)
+        & Key("timestamp").between(start_time, end_time),
+        "ProjectionExpression": "#ts, easy, medium, hard, #ttl",
+        "ExpressionAttributeNames": {"#ts": "timestamp", "#ttl": "total"},
+    }
+    while True:
+        # Runs in pool threads, which may share the client but not the table
+        response = progress_table.meta.client.query(**query_kwargs)
+        samples.extend(response.get("Items", []))
+        if "LastEvaluatedKey" not in response:
+            break
+        query_kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+    sample_timestamps = [int(item["timestamp"]) for item in samples]
+
+    carried = {}
+    for ts in timestamps:
+        i = bisect_right(sample_timestamps, ts)
+        if i == 0:
+            continue
+        carried[ts] = {
+            counter: int(samples[i - 1].get(counter, 0))
+            for counter in PROGRESS_COUNTERS
+        }
+    return carried
+
+
+def fetch_rollups(
+    username: str, granularity: str, start_time: int, end_time: int
+) -> list[dict]:
+    """Fetches the rollup items of a user between the given bucket starts."""
+    items = []
+    query_kwargs = {
+        "TableName": progress_table.name,
+        "KeyConditionExpression": Key("username").eq(
+            f"rollup#{granularity}#{username}"
+        )
+        & Key("timestamp").between(start_time, end_time),
+        "ProjectionExpression": "#ts, sample_timestamp, easy, medium, hard, #ttl",
+        "ExpressionAttributeNames": {"#ts": "timestamp", "#ttl": "total"},
+    }
+    while True:
+        # Runs in pool threads, which may share the client but not the table
+        response = progress_table.meta.client.query(**query_kwargs)
+        items.extend(response.get("Items", []))
+        if "LastEvaluatedKey" not in response:
+            break
+        query_kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+    return items
+
+
+def find_rollup_granularity(
+    time_starts: list[int], time_delta: timedelta
+) -> str | None:
+    """Finds the coarsest rollup whose buckets tile the given intervals."""
+    time_delta_seconds = int(time_delta.total_seconds())
+    for granularity, seconds in ROLLUP_GRANULARITIES.items():
+        if time_delta_seconds % seconds == 0 and all(
+            time_start % seconds == 0 for time_start in time_starts
+        ):
+            return granularity
+    return None
+
+
 def find_timestamps(
     all_timestamps: list[int],
     time_starts: list[int],
     time_delta: timedelta,
-) -> tuple[dict[int, int], bool]:
-    """Finds the timestamps that fall within the time intervals and aligns them with the start of the intervals."""
+) -> dict[int, int]:
+    """Finds the timestamps that fall within the time intervals and aligns them with the start of the intervals.
+
+    Args:
+        all_timestamps (list[int]): The candidate timestamps, sorted in ascending order.
+        time_starts (list[int]): The start of each time interval.
+        time_delta (timedelta): The length of the time intervals.
+
+    Returns:
+        dict[int, int]: A dictionary mapping the first timestamp of each interval to the start of the interval.
+    """
     time_delta_seconds = int(time_delta.total_seconds())
     selected_timestamps = {}
     for time_start in time_starts:
-        time_end = time_start + time_delta_seconds
-        candidates = [
-            ts for ts in all_timestamps if time_start <= ts < time_end
-        ]
-        if candidates:
-            selected_timestamps[min(candidates)] = time_start
+        # The first timestamp at or after the start of the interval
+        i = bisect_left(all_timestamps, time_start)
+        if (
+            i < len(all_timestamps)
+            and all_timestamps[i] < time_start + time_delta_seconds
+        ):
+            selected_timestamps[all_timestamps[i]] = time_start
     return selected_timestamps
 
 
 def fetch_progress_data(
     all_selected_timestamps: dict[str, dict[int, int]],
+    performance: dict | None = None,
 ) -> dict:
     """Fetches user progress data for the given timestamps.
 
     Args:
         all_selected_timestamps (dict[str, dict[int, int]]): A dictionary mapping usernames to their selected timestamps.
+        performance (dict | None): If given, the batch read retries and consumed capacity are added to it.
 
     Returns:
         dict: A dictionary containing the progress data for each user.
     """
     data = {}
 
+    # Unchanged samples are not stored when the scraper runs with
+    # DELTA_WRITES, so each user's samples are read with one query and the
+    # last one is carried over to the timestamps without a sample
+    if environment.delta_writes:
+        usernames = [
+            username
+            for username, selected_timestamps in all_selected_timestamps.items()
+            if selected_timestamps
+        ]
+        with ThreadPoolExecutor(
+            max_workers=environment.fetch_concurrency
+        ) as executor:
+            all_carried = executor.map(
+                lambda username: fetch_carried_samples(
+                    username,
+                    [int(ts) for ts in all_selected_timestamps[username]],
+                ),
+                usernames,
+            )
+            for username, carried in zip(usernames, all_carried):
+                selected_timestamps = all_selected_timestamps[username]
+                for sample_ts, time_start in selected_timestamps.items():
+                    counters = carried.get(int(sample_ts))
+                    if counters is not None:
+                        data.setdefault(time_start, {})[username] = counters
+        if performance is not None:
+            performance["carried_queries"] = performance.get(
+                "carried_queries", 0
+            ) + len(usernames)
+        return data
+
     # Flatten the request keys for batch processing
     request_keys = [
         {"username": username, "timestamp": ts}
         for username, selected_timestamps in all_selected_timestamps.items()
         for ts in selected_timestamps.keys()
     ]
-    # Split the request keys into batches of 100 to avoid exceeding the limit
-    for i in range(0, len(request_keys), 100):
-        batch_request_keys = request_keys[i : i + 100]
-        response = dynamodb.meta.client.batch_get_item(
-            RequestItems={
-                progress_table.name: {
-                    "Keys": batch_request_keys,
-                    "ProjectionExpression": "#ts, username, easy, medium, hard, #ttl",
-                    "ExpressionAttributeNames": {
-                        "#ts": "timestamp",
-                        "#ttl": "total",
-                    },
-                }
-            }
-        )
-        for item in response["Responses"].get(progress_table.name, []):
-            username = item["username"]
-            ts = all_selected_timestamps[username][item["timestamp"]]
-            if ts not in data:
-                data[ts] = {}
-            data[ts][username] = {
-                "easy": int(item.get("easy", 0)),
-                "medium": int(item.get("medium", 0)),
-                "hard": int(item.get("hard", 0)),
-                "total": int(item.get("total", 0)),
-            }
+    items = batch_get_items(
+        dynamodb.meta.client,
+        progress_table.name,
+        request_keys,
+        max_workers=environment.fetch_concurrency,
+        performance=performance,
+        ProjectionExpression="#ts, username, easy, medium, hard, #ttl",
+        ExpressionAttributeNames={
+            "#ts": "timestamp",
+            "#ttl": "total",
+        },
+    )
+    for item in items:
+        username = item["username"]
+        ts = all_selected_timestamps[username][item["timestamp"]]
+        if ts not in data:
+            data[ts] = {}
+        data[ts][username] = {
+            "easy": int(item.get("easy", 0)),
+            "medium": int(item.get("medium", 0)),
+            "hard": int(item.get("hard", 0)),
+            "total": int(item.get("total", 0)),
+        }
 
     return data
 
@@ -193,76 +399,318 @@ def calculate_time_intervals(
         ]
 
 
-def get_progress_data(
+def assemble_progress_data(
+    data: dict,
+    usernames: list[str],
+    duplicate_last_at: float | None = None,
+) -> dict:
+    """Sorts the progress data by timestamp and fills in the missing samples.
+
+    The data is laid out as a dense (timestamps x users x counters) array,
+    where the samples missing for a user are filled with the first value of
+    that user. Users without any sample are left out.
+
+    Args:
+        data (dict): The progress data, as `{timestamp: {username: counters}}`.
+        usernames (list[str]): The usernames, in the order of the output.
+        duplicate_last_at (float | None): If given, the last timestamp is
+            duplicated at this timestamp.
+    """
+    # Imported here as cached responses never need it
+    import numpy as np
+
+    timestamps = sorted(data.keys())
+    if not timestamps:
+        return {}
+    user_indices = {username: i for i, username in enumerate(usernames)}
+    values = np.zeros(
+        (len(timestamps), len(usernames), len(PROGRESS_COUNTERS)),
+        dtype=np.int64,
+    )
+    present = np.zeros((len(timestamps), len(usernames)), dtype=bool)
+    for t, ts in enumerate(timestamps):
+        for username, counters in data[ts].items():
+            u = user_indices.get(username)
+            if u is None:
+                continue
+            values[t, u] = [counters[counter] for counter in PROGRESS_COUNTERS]
+            present[t, u] = True
+
+    # Fill in missing timestamps with first value for each user
+    has_data = present.any(axis=0)
+    first_values = values[present.argmax(axis=0), np.arange(len(usernames))]
+    values = np.where(present[:, :, np.newaxis], values, first_values)
+    if duplicate_last_at is not None:
+        timestamps.append(duplicate_last_at)
+        values = np.concatenate([values, values[-1:]])
+
+    # Serialize back into the nested response shape
+    usernames_with_data = [
+        (u, username) for u, username in enumerate(usernames) if has_data[u]
+    ]
+    rows = values.tolist()
+    return {
+        ts: {
+            username: dict(zip(PROGRESS_COUNTERS, row[u]))
+            for u, username in usernames_with_data
+        }
+        for ts, row in zip(timestamps, rows)
+    }
+
+
+def to_columnar_progress(response: dict) -> dict:
+    """Converts an interval progress response into a columnar layout.
+
+    Timestamps and usernames are listed once, and each counter is a
+    (timestamps x usernames) integer matrix, with `None` where a user has no
+    sample. The other fields of the response are kept as is.
+    """
+    if "data" not in response:
+        return response
+    usernames = response.get("usernames") or []
+    timestamps = []
+    matrices = {counter: [] for counter in PROGRESS_COUNTERS}
+    for ts, records in response["data"].items():
+        # Cached responses have their timestamps as JSON object keys
+        ts = float(ts)
+        timestamps.append(int(ts) if ts.is_integer() else ts)
+        for counter in PROGRESS_COUNTERS:
+            matrices[counter].append(
+                [
+                    records[username][counter] if username in records else None
+                    for username in usernames
+                ]
+            )
+    columnar = {key: value for key, value in response.items() if key != "data"}
+    columnar["format"] = "columnar"
+    columnar["timestamps"] = timestamps
+    columnar["usernames"] = usernames
+    columnar.update(matrices)
+    return columnar
+
+
+def build_progress_data_from_rollups(
+    usernames: list[str],
     time_delta: timedelta,
     limit: int,
-    timezone_str: str = "UTC",
-    followed_by: str = None,
-) -> dict:
-    # If cache is not fresh, fetch the data
+    now: datetime,
+    performance: dict,
+) -> dict | None:
+    """Builds the interval progress series from the rollup items.
+
+    Returns:
+        dict | None: The progress data, or None if the intervals do not align
+            with the rollup buckets, e.g. for timezones with a half-hour offset.
+    """
+    time_starts = calculate_time_intervals(now, time_delta, limit)
+    granularity = find_rollup_granularity(time_starts, time_delta)
+    if granularity is None:
+        return None
+    performance["rollups"] = granularity
+    time_delta_seconds = int(time_delta.total_seconds())
+
+    # Fetch the rollups of each user, one query per user
+    start_perf = perf_counter()
+    with ThreadPoolExecutor(
+        max_workers=environment.fetch_concurrency
+    ) as executor:
+        all_rollups = dict(
+            zip(
+                usernames,
+                executor.map(
+                    lambda username: fetch_rollups(
+                        username,
+                        granularity,
+                        time_starts[0],
+                        int(now.timestamp()),
+                    ),
+                    usernames,
+                ),
+            )
+        )
+    performance["parallelism"] = min(
+        environment.fetch_concurrency, len(usernames)
+    )
+    performance["get_progress"] += perf_counter() - start_perf
+
+    # Align the first rollup of each interval with the start of the interval
+    start_perf = perf_counter()
     data = {}
-    performance = {
-        "get_users": 0,
-        "get_timestamps": 0,
-        "find_timestamps": 0,
-        "get_first_timestamp": 0,
-        "get_progress": 0,
-    }
+    selected_timestamps = set()
+    for username, rollups in all_rollups.items():
+        rollups = sorted(rollups, key=lambda item: int(item["timestamp"]))
+        i = 0
+        for time_start in time_starts:
+            while (
+                i < len(rollups) and int(rollups[i]["timestamp"]) < time_start
+            ):
+                i += 1
+            if i == len(rollups):
+                break
+            item = rollups[i]
+            if int(item["timestamp"]) >= time_start + time_delta_seconds:
+                continue
+            if username == REFERENCE_USERNAME:
+                selected_timestamps.add(int(item["sample_timestamp"]))
+            data.setdefault(time_start, {})[username] = {
+                "easy": int(item.get("easy", 0)),
+                "medium": int(item.get("medium", 0)),
+                "hard": int(item.get("hard", 0)),
+                "total": int(item.get("total", 0)),
+            }
+    performance["find_timestamps"] += perf_counter() - start_perf
 
-    try:
-        tz = pytz.timezone(timezone_str)
-    except pytz.UnknownTimeZoneError:
-        return {"error": f"Invalid timezone: {timezone_str}"}
-    now = datetime.now(tz)
+    # Add the latest sample if it is not the first of its interval
+    start_perf = perf_counter()
+    latest_timestamp = fetch_latest_scrape_timestamp(now)
+    performance["get_timestamps"] += perf_counter() - start_perf
+    start_perf = perf_counter()
+    is_latest_added = (
+        latest_timestamp is not None
+        and latest_timestamp not in selected_timestamps
+    )
+    if is_latest_added:
+        data.update(
+            fetch_progress_data(
+                {
+                    username: {latest_timestamp: int(now.timestamp())}
+                    for username in usernames
+                },
+                performance,
+            )
+        )
+    performance["get_progress"] += perf_counter() - start_perf
 
     start_perf = perf_counter()
-    if followed_by:
-        usernames = fetch_usernames_by_following(followed_by)
-    else:
-        usernames = fetch_usernames()
-    performance["get_users"] = perf_counter() - start_perf
+    data = assemble_progress_data(
+        data,
+        usernames,
+        # Duplicate the last timestamp if not added
+        duplicate_last_at=None if is_latest_added else now.timestamp(),
+    )
+    performance["assemble"] = perf_counter() - start_perf
+    return data
 
-    # Fetch the data from the cache if available
-    hashed_usernames = sha256(",".join(usernames).encode("utf-8")).hexdigest()
-    cache_key = f"progress:get_progress_data:{int(time_delta.total_seconds())}:{limit}:{timezone_str}:{hashed_usernames}"
-    if cache.is_cache_fresh(cache_key, ttl=300):
-        cached_data = cache.get_cache(cache_key)
-        if cached_data:
-            cached_data["source"] = "cache"
-            cached_data["performance"] = performance
-            return cached_data
+
+def build_progress_data(
+    usernames: list[str],
+    time_delta: timedelta,
+    limit: int,
+    now: datetime,
+    performance: dict,
+    state: dict | None = None,
+    first_timestamps: dict[str, int | None] | None = None,
+) -> tuple[dict, dict | None]:
+    """Builds the interval progress series of the given users from DynamoDB.
+
+    Args:
+        state (dict | None): The state returned by a previous call for the
+            same users and view. When given, only the samples scraped after
+            it and those of its newest INCREMENTAL_REREAD_BUCKETS buckets are
+            read, and the buckets that left the window are dropped.
+        first_timestamps (dict[str, int | None] | None): The first scraped
+            timestamp of each user, as stored on the users items. Users
+            without one are looked up in the progress table.
+
+    Returns:
+        tuple[dict, dict | None]: The progress data and the state for the
+            next call, None if the data was built from the rollups.
+    """
+    if environment.progress_rollups:
+        data = build_progress_data_from_rollups(
+            usernames, time_delta, limit, now, performance
+        )
+        if data is not None:
+            return data, None
 
     # Calculate the time intervals for alignment
     time_starts = calculate_time_intervals(now, time_delta, limit)
 
-    # Select and align timestamps for each user
-    is_latest_added = False
-    all_selected_timestamps = {}
+    # Restore the buckets of the previous series still in the window
+    buckets = {}
+    bucket_data = {}
+    last_timestamp = None
+    start_time = None
+    if state:
+        buckets = {
+            int(time_start): int(ts)
+            for time_start, ts in state["buckets"].items()
+            if int(time_start) in time_starts
+        }
+        last_timestamp = state["last_timestamp"]
+        start_time = last_timestamp + 1
+        reread = max(0, len(buckets) - INCREMENTAL_REREAD_BUCKETS)
+        for time_start in sorted(buckets)[reread:]:
+            start_time = min(start_time, buckets.pop(time_start))
+        bucket_data = {
+            int(time_start): records
+            for time_start, records in state["data"].items()
+            if int(time_start) in buckets
+        }
+    is_incremental = bool(buckets)
+    performance["incremental"] = is_incremental
 
-    # Fetch all timestamps for the user
+    # Fetch all timestamps for the user, only the new ones if incremental
     start_perf = perf_counter()
-    all_timestamps = fetch_timestamps("dasbd72", time_delta, limit, now)
+    all_timestamps = fetch_scrape_timestamps(
+        time_delta,
+        limit,
+        now,
+        start_time=start_time if is_incremental else None,
+    )
     performance["get_timestamps"] += perf_counter() - start_perf
 
     # Find the timestamps that fall within the time intervals
     # and align them with the start of the intervals
     start_perf = perf_counter()
     selected_timestamps = find_timestamps(
-        all_timestamps, time_starts, time_delta
+        all_timestamps,
+        [
+            time_start
+            for time_start in time_starts
+            if time_start not in buckets
+        ],
+        time_delta,
     )
+    buckets.update(
+        {time_start: ts for ts, time_start in selected_timestamps.items()}
+    )
+    if all_timestamps:
+        last_timestamp = all_timestamps[-1]
     # If the last timestamp is not in the selected timestamps, add it
-    if all_timestamps and all_timestamps[-1] not in selected_timestamps:
+    is_latest_added = False
+    if last_timestamp is not None and last_timestamp not in buckets.values():
         is_latest_added = True
-        selected_timestamps[all_timestamps[-1]] = int(now.timestamp())
+        selected_timestamps[last_timestamp] = int(now.timestamp())
     performance["find_timestamps"] += perf_counter() - start_perf
 
     # Prune selected timestamps to only include those after the first timestamp
     # for each user
     start_perf = perf_counter()
-    for username in usernames:
-        first_timestamp = fetch_first_timestamp(
-            username, time_delta, limit, now
-        )
+    all_selected_timestamps = {}
+    if is_incremental:
+        # Samples missing for a user are simply absent from the response
+        first_timestamps = dict.fromkeys(usernames, 0)
+    else:
+        first_timestamps = {
+            username: (first_timestamps or {}).get(username)
+            for username in usernames
+        }
+        missing_usernames = [
+            username
+            for username, first_timestamp in first_timestamps.items()
+            if first_timestamp is None
+        ]
+        if missing_usernames:
+            first_timestamps.update(
+                fetch_first_timestamps(
+                    missing_usernames, time_delta, limit, now
+                )
+            )
+            performance["parallelism"] = min(
+                environment.fetch_concurrency, len(missing_usernames)
+            )
+    for username, first_timestamp in first_timestamps.items():
         if first_timestamp is None:
             continue
         # Prune selected timestamps to only include those after the first timestamp
@@ -275,50 +723,174 @@ def get_progress_data(
 
     # Fetch the progress data for all users
     start_perf = perf_counter()
-    data = fetch_progress_data(all_selected_timestamps)
-    # Duplicate the last timestamp if not added
-    if not is_latest_added and data:
-        last_timestamp = max(data.keys())
-        data[now.timestamp()] = data[last_timestamp]
+    fetched_data = fetch_progress_data(all_selected_timestamps, performance)
+    latest_data = None
+    if is_latest_added:
+        latest_data = fetched_data.pop(int(now.timestamp()), None)
+    bucket_data.update(fetched_data)
+    data = dict(bucket_data)
+    if latest_data is not None:
+        data[int(now.timestamp())] = latest_data
     performance["get_progress"] += perf_counter() - start_perf
 
-    # Sort the data by timestamp
-    data = dict(sorted(data.items()))
-    # Fill in missing timestamps with first value for each user
-    for username in all_selected_timestamps:
-        first_data = None
-        for ts in data:
-            if username in data[ts]:
-                first_data = ts
-                break
-        if first_data is None:
-            continue
-        for ts in data:
-            if username not in data[ts]:
-                data[ts][username] = data[first_data][username]
+    start_perf = perf_counter()
+    data = assemble_progress_data(
+        data,
+        usernames,
+        # Duplicate the last timestamp if not added
+        duplicate_last_at=None if is_latest_added else now.timestamp(),
+    )
+    performance["assemble"] = perf_counter() - start_perf
 
-    response = {
-        "data": data,
-        "performance": performance,
-        "usernames": usernames,
-        "source": "dynamodb",
+    state = {
+        "data": bucket_data,
+        "buckets": buckets,
+        "last_timestamp": last_timestamp,
     }
+    return data, state
 
-    # Store the data in the cache
-    cache.put_cache(cache_key, response)
-    return response
 
+def get_progress_data(
+    time_delta: timedelta,
+    limit: int,
+    timezone_str: str = "UTC",
+    followed_by: str = None,
+    refresh: bool = False,
+    encodings: list[str] | None = None,
+    users: dict[str, int | None] | None = None,
+) -> dict | Response:
+    """
+    Returns the interval progress series, served from the cache when possible.
+    With `refresh`, the cache is skipped and the entry is recomputed.
+    With `encodings`, a fresh cached response compressed with one of them is
+    returned as is, as a Response with its Content-Encoding.
+    `users` are the users already resolved by the caller, see `fetch_users`.
+    """
+    performance = {
+        "get_users": 0,
+        "get_timestamps": 0,
+        "find_timestamps": 0,
+        "get_first_timestamp": 0,
+        "get_progress": 0,
+    }
+
+    try:
+        tz = pytz.timezone(timezone_str)
+    except pytz.UnknownTimeZoneError:
+        return {"error": f"Invalid timezone: {timezone_str}"}
+    now = datetime.now(tz)
+
+    start_perf = perf_counter()
+    if users is None:
+        if followed_by:
+            users = fetch_users_by_following(followed_by)
+        else:
+            users = fetch_users()
+    usernames = list(users.keys())
+    performance["get_users"] = perf_counter() - start_perf
 
-@router.get("/progress/latest")
-def get_latest_user_progress():
     # Fetch the data from the cache if available
-    cache_key = "progress:get_latest_user_progress"
-    if cache.is_cache_fresh(cache_key, ttl=300):
-        cached_data = cache.get_cache(cache_key)
-        if cached_data:
-            cached_data["source"] = "cache"
+    hashed_usernames = hash_usernames(usernames)
+    cache_key, previous_key, ttl = cache.versioned_key(
+        f"progress:get_progress_data:{int(time_delta.total_seconds())}:{limit}:{timezone_str}:{hashed_usernames}",
+        ttl=300,
+    )
+    cached_data, is_fresh = None, False
+    has_entry = True
+    if encodings and not refresh:
+        encoded, has_entry = cache.get_encoded(cache_key, encodings, ttl=ttl)
+        if encoded is not None:
+            body, codec = encoded
+            return Response(
+                content=body,
+                media_type="application/json",
+                headers={"Content-Encoding": codec},
+            )
+    if not refresh:
+        # Already looked up when probing for an encoded response
+        if has_entry:
+            cached_data, is_fresh = cache.get_entry(cache_key, ttl=ttl)
+        if cached_data is None and previous_key:
+            # The previous generation is served as stale until recomputed
+            cached_data, _ = cache.get_entry(previous_key, ttl=ttl)
+    if cached_data and is_fresh:
+        performance["cache"] = cache.get_stats()
+        cached_data["source"] = "cache"
+        cached_data["performance"] = performance
+        return cached_data
+
+    # Serve the stale entry while another Lambda is refreshing it
+    has_lease = False
+    if cached_data:
+        has_lease = cache.acquire_lease(cache_key)
+        if not has_lease:
+            performance["cache"] = cache.get_stats()
+            cached_data["source"] = "stale-cache"
+            cached_data["performance"] = performance
             return cached_data
 
+    # If cache is not fresh, fetch the data
+    try:
+        # Extend the series computed for the previous generation
+        state_key = f"progress:series:{int(time_delta.total_seconds())}:{limit}:{timezone_str}:{hashed_usernames}"
+        state = None
+        if environment.incremental_progress:
+            state = cache.get_fresh(state_key, ttl=cache.CACHE_MAX_STALE)
+        data, state = build_progress_data(
+            usernames,
+            time_delta,
+            limit,
+            now,
+            performance,
+            state=state,
+            first_timestamps=users,
+        )
+
+        performance["cache"] = cache.get_stats()
+        response = {
+            "data": data,
+            "performance": performance,
+            "usernames": usernames,
+            "source": "dynamodb",
+        }
+
+        # Store the response as sent to the clients that accept gzip, with a
+        # placeholder instead of the metadata of this request
+        cache.put_cache(
+            cache_key,
+            {
+                **response,
+                "performance": {"cache": "passthrough"},
+                "source": "cache",
+            },
+            ttl=ttl,
+            serializer="json+gzip",
+        )
+        if environment.incremental_progress and state is not None:
+            cache.put_cache(state_key, state, ttl=cache.CACHE_MAX_STALE)
+    finally:
+        if has_lease:
+            cache.release_lease(cache_key)
+    return response
+
+
+def get_latest_progress_data(refresh: bool = False) -> dict:
+    """
+    Returns the latest progress of every user, served from the cache when
+    possible. With `refresh`, the cache is skipped and the entry is recomputed.
+    """
+    # Fetch the data from the cache if available
+    cache_key, _, ttl = cache.versioned_key(
+        "progress:get_latest_user_progress", ttl=300
+    )
+    cached_data = None
+    if not refresh:
+        cached_data = cache.get_fresh(cache_key, ttl=ttl)
+    if cached_data:
+        cached_data["source"] = "cache"
+        cached_data["performance"] = {"cache": cache.get_stats()}
+        return cached_data
+
     # If cache is not fresh, fetch the data
     data = {}
     usernames = []
@@ -327,8 +899,10 @@ def get_latest_user_progress():
     }
 
     start_perf = perf_counter()
-    response = users_table.scan()
-    user_items = response.get("Items", [])
+    user_items = parallel_scan(
+        users_table,
+        ProjectionExpression="leetcode_username, latest_timestamp, latest_easy, latest_medium, latest_hard, latest_total",
+    )
     for user_item in user_items:
         leetcode_username = user_item.get("leetcode_username", "")
         data[leetcode_username] = {
@@ -341,20 +915,108 @@ def get_latest_user_progress():
     data = dict(sorted(data.items()))
     usernames = list(data.keys())
     performance["get_users"] = perf_counter() - start_perf
+    performance["cache"] = cache.get_stats()
 
     response = {
         "data": data,
+        "performance": performance,
         "usernames": usernames,
         "source": "dynamodb",
     }
 
     # Store the data in the cache
-    cache.put_cache(cache_key, response)
+    cache.put_cache(cache_key, response, ttl=ttl)
     return response
 
 
+def progress_etag(request: Request, vary: str = "") -> str | None:
+    """
+    Returns a weak ETag for the request, derived from its path, its query,
+    `vary` (e.g. the hash of the resolved users) and the current data
+    generation, so that it changes after every scrape and whenever the
+    users of the response change.
+    Without a generation marker, no ETag is returned.
+    """
+    marker = cache.get_generation()
+    if not marker:
+        return None
+    query = "&".join(
+        sorted(f"{k}={v}" for k, v in request.query_params.items())
+    )
+    key = f"{request.url.path}?{query}:{vary}:{marker['generation']}"
+    return f'W/"{sha256(key.encode("utf-8")).hexdigest()[:32]}"'
+
+
+def progress_max_age() -> int:
+    """Returns the number of seconds until the next scrape is expected."""
+    interval = environment.scrape_interval
+    marker = cache.get_generation()
+    now = time()
+    if marker:
+        next_scrape = int(marker["generation"]) + interval
+    else:
+        next_scrape = (int(now) // interval + 1) * interval
+    return max(0, int(next_scrape - now))
+
+
+def conditional_get(
+    request: Request,
+    response: Response,
+    compute,
+    private: bool = False,
+    vary: str = "",
+):
+    """
+    Answers `If-None-Match` with 304 Not Modified when the client already has
+    the data of the current generation, otherwise returns `compute()` with
+    its ETag and a Cache-Control header expiring at the next scrape.
+    Private responses depend on per-user settings that can change at any
+    time, so they are always revalidated instead.
+    """
+    etag = progress_etag(request, vary)
+    if private:
+        headers = {"Cache-Control": "private, no-cache"}
+    else:
+        headers = {"Cache-Control": f"public, max-age={progress_max_age()}"}
+    if etag:
+        headers["ETag"] = etag
+        if_none_match = request.headers.get("if-none-match", "")
+        candidates = [tag.strip() for tag in if_none_match.split(",")]
+        # If-None-Match uses the weak comparison
+        if "*" in candidates or etag[2:] in [
+            tag.removeprefix("W/") for tag in candidates
+        ]:
+            return Response(status_code=304, headers=headers)
+
+    data = compute()
+    if isinstance(data, Response):
+        data.headers.update(headers)
+        return data
+    if "error" in data:
+        return data
+    if data.get("source") == "stale-cache":
+        # The data belongs to the previous generation, so it must not be
+        # cached under the current ETag
+        response.headers["Cache-Control"] = "no-cache"
+        return data
+    response.headers.update(headers)
+    return data
+
+
+@router.get("/progress/latest")
+def get_latest_user_progress(request: Request, response: Response):
+    return conditional_get(
+        request,
+        response,
+        get_latest_progress_data,
+        vary=hash_usernames(list(fetch_users())),
+    )
+
+
 @router.get("/progress/latest/interval")
 def get_latest_interval_progress(
+    request: Request,
+    response: Response,
     hours: int = Query(1, description="Interval in hours", ge=1, le=24),
     limit: int = Query(
         24, description="Number of intervals to look back", ge=1, le=50
@@ -362,13 +1024,35 @@ def get_latest_interval_progress(
     timezone: str = Query(
         "UTC", description="Timezone name, e.g., 'Asia/Taipei'"
     ),
+    format: Literal["json", "columnar"] = Query(
+        "json", description="Response layout, 'json' or 'columnar'"
+    ),
 ):
-    time_delta = timedelta(hours=hours)
-    return get_progress_data(time_delta, limit, timezone)
+    encodings = accepted_encodings(request.headers.get("accept-encoding"))
+    users = fetch_users()
+
+    def compute() -> dict | Response:
+        time_delta = timedelta(hours=hours)
+        progress = get_progress_data(
+            time_delta,
+            limit,
+            timezone,
+            encodings=encodings if format == "json" else None,
+            users=users,
+        )
+        if format == "columnar":
+            return to_columnar_progress(progress)
+        return progress
+
+    return conditional_get(
+        request, response, compute, vary=hash_usernames(list(users))
+    )
 
 
 @router.get("/auth/progress/latest/interval")
 def get_auth_latest_interval_progress(
+    request: Request,
+    response: Response,
     hours: int = Query(1, description="Interval in hours", ge=1, le=24),
     limit: int = Query(
         24, description="Number of intervals to look back", ge=1, le=50
@@ -376,13 +1060,39 @@ def get_auth_latest_interval_progress(
     timezone: str = Query(
         "UTC", description="Timezone name, e.g., 'Asia/Taipei'"
     ),
+    format: Literal["json", "columnar"] = Query(
+        "json", description="Response layout, 'json' or 'columnar'"
+    ),
     claims: dict = Depends(get_claims),
 ):
-    time_delta = timedelta(hours=hours)
     username = claims.get("username")
     if not username:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Username not found in claims",
         )
-    return get_progress_data(time_delta, limit, timezone, followed_by=username)
+
+    encodings = accepted_encodings(request.headers.get("accept-encoding"))
+    users = fetch_users_by_following(username)
+
+    def compute() -> dict | Response:
+        time_delta = timedelta(hours=hours)
+        progress = get_progress_data(
+            time_delta,
+            limit,
+            timezone,
+            followed_by=username,
+            encodings=encodings if format == "json" else None,
+            users=users,
+        )
+        if format == "columnar":
+            return to_columnar_progress(progress)
+        return progress
+
+    return conditional_get(
+        request,
+        response,
+        compute,
+        private=True,
+        vary=f"{username}:{hash_usernames(list(users))}",
+    )
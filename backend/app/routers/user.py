@@ -1,17 +1,13 @@
-import boto3
+import clients
 from authentication import get_claims
+from directory import users_directory
 from environment import environment
 from fastapi import APIRouter, Depends, HTTPException, status
 from pydantic import BaseModel
 
 router = APIRouter()
 
-# Create Cognito client
-cognito = boto3.client("cognito-idp", region_name="ap-northeast-1")
-
-# Create DynamoDB resource
-dynamodb = boto3.resource("dynamodb")
-users_table = dynamodb.Table(environment.users_table_name)
+users_table = clients.lazy_table(environment.users_table_name)
 
 
 class User(BaseModel):
@@ -31,31 +27,15 @@ async def get_user_list(
             detail="Username not found in claims",
         )
     try:
-        done = False
-        last_evaluated_key = None
-        user_list = []
-        while not done:
-            if last_evaluated_key:
-                response = users_table.scan(
-                    ExclusiveStartKey=last_evaluated_key,
-                    PrjojectionExpression="username, preferred_username, leetcode_username",
-                )
-            else:
-                response = users_table.scan()
-            items = response.get("Items", [])
-            user_list.extend(
-                User(
-                    username=item["username"],
-                    preferred_username=item.get("preferred_username", ""),
-                    leetcode_username=item.get("leetcode_username", ""),
-                )
-                for item in items
-                if "username" in item
+        user_list = [
+            User(
+                username=item["username"],
+                preferred_username=item.get("preferred_username", ""),
+                leetcode_username=item.get("leetcode_username", ""),
             )
-            if "LastEvaluatedKey" not in response:
-                done = True
-            else:
-                last_evaluated_key = response["LastEvaluatedKey"]
+            for item in users_directory.get_items()
+            if "username" in item
+        ]
     except Exception as e:
         print(f"Error fetching users: {e}")
         raise HTTPException(
@@ -127,6 +107,7 @@ async def update_user_settings(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Failed to update user settings in DynamoDB",
             )
+        users_directory.invalidate()
     except Exception as e:
         print(f"Error updating user settings for {username}: {e}")
         raise HTTPException(
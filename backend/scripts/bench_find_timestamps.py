@@ -0,0 +1,41 @@
+import argparse
+import timeit
+from datetime import timedelta
+
+from test_find_timestamps import find_timestamps, find_timestamps_linear
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compares find_timestamps with the previous linear scan."
+    )
+    parser.add_argument("--hours", type=int, default=24)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--samples-per-hour", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    time_delta = timedelta(hours=args.hours)
+    span = (args.limit + 1) * args.hours * 3600
+    step = 3600 // args.samples_per_hour
+    all_timestamps = list(range(0, span, step))
+    time_starts = [i * args.hours * 3600 for i in range(args.limit)]
+    print(
+        f"{len(all_timestamps)} timestamps, {len(time_starts)} intervals "
+        f"of {args.hours} h"
+    )
+
+    for name, function in (
+        ("bisect", find_timestamps),
+        ("linear", find_timestamps_linear),
+    ):
+        timer = timeit.Timer(
+            lambda: function(all_timestamps, time_starts, time_delta)
+        )
+        number, _ = timer.autorange()
+        best = min(timer.repeat(repeat=args.repeat, number=number)) / number
+        print(f"{name:>8}: {best * 1e6:>10.1f} us per call")
+
+
+if __name__ == "__main__":
+    main()
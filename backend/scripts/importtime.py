@@ -0,0 +1,76 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+
+def measure_import(module: str, env: dict) -> dict[str, tuple[int, int]]:
+    """
+    Imports the module in a fresh interpreter with `-X importtime` and returns
+    the self and cumulative import time of every module, in microseconds.
+    """
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if process.returncode != 0:
+        print(process.stderr)
+        raise SystemExit(f"Failed to import {module}")
+    times = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        if not self_us.strip().isdigit():
+            # Header line
+            continue
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Reports the import time of the Lambda handler module."
+    )
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument(
+        "--budget-ms",
+        type=float,
+        default=None,
+        help="Exit with an error if the median import time exceeds it",
+    )
+    args = parser.parse_args()
+
+    os.chdir("app")
+    env = os.environ.copy()
+    env.setdefault("AWS_DEFAULT_REGION", "ap-northeast-1")
+    env["PRODUCTION"] = "false"
+
+    runs = [measure_import(args.module, env) for _ in range(args.repeat)]
+    totals = [run[args.module][1] / 1000 for run in runs]
+    median = statistics.median(totals)
+
+    # Report the run closest to the median
+    run = min(runs, key=lambda r: abs(r[args.module][1] / 1000 - median))
+    print(f"{'self (ms)':>10} {'cumulative (ms)':>16}  module")
+    ranked = sorted(run.items(), key=lambda item: item[1][1], reverse=True)
+    for name, (self_us, cumulative_us) in ranked[: args.top]:
+        print(f"{self_us / 1000:>10.1f} {cumulative_us / 1000:>16.1f}  {name}")
+    print(
+        f"import {args.module}: median {median:.1f} ms, "
+        f"min {min(totals):.1f} ms, max {max(totals):.1f} ms "
+        f"over {args.repeat} runs"
+    )
+
+    if args.budget_ms is not None and median > args.budget_ms:
+        print(f"Import time exceeds the budget of {args.budget_ms:.1f} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import os
+import random
+import sys
+import unittest
+from datetime import timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+os.environ.setdefault("AWS_DEFAULT_REGION", "ap-northeast-1")
+os.environ["PRODUCTION"] = "false"
+
+from routers.progress import find_timestamps  # noqa: E402
+
+
+def find_timestamps_linear(
+    all_timestamps: list[int],
+    time_starts: list[int],
+    time_delta: timedelta,
+) -> dict[int, int]:
+    """The previous implementation, scanning every timestamp per interval."""
+    time_delta_seconds = int(time_delta.total_seconds())
+    selected_timestamps = {}
+    for time_start in time_starts:
+        time_end = time_start + time_delta_seconds
+        candidates = [
+            ts for ts in all_timestamps if time_start <= ts < time_end
+        ]
+        if candidates:
+            selected_timestamps[min(candidates)] = time_start
+    return selected_timestamps
+
+
+class FindTimestampsTest(unittest.TestCase):
+    def test_matches_linear_scan(self):
+        rnd = random.Random(0)
+        for _ in range(2000):
+            hours = rnd.choice([1, 3, 24])
+            time_delta = timedelta(hours=hours)
+            start = rnd.randrange(0, 10**6)
+            all_timestamps = sorted(
+                rnd.sample(
+                    range(start, start + 72 * 3600), rnd.randint(0, 200)
+                )
+            )
+            time_starts = [
+                start + rnd.randint(-3600, 3600) + i * hours * 3600
+                for i in range(rnd.randint(0, 50))
+            ]
+            self.assertEqual(
+                find_timestamps(all_timestamps, time_starts, time_delta),
+                find_timestamps_linear(
+                    all_timestamps, time_starts, time_delta
+                ),
+            )
+
+    def test_interval_bounds(self):
+        time_delta = timedelta(hours=1)
+        # The start of an interval is included, its end is not
+        self.assertEqual(
+            find_timestamps([3600, 7199, 7200], [3600, 7200], time_delta),
+            {3600: 3600, 7200: 7200},
+        )
+        self.assertEqual(find_timestamps([], [0, 3600], time_delta), {})
+        self.assertEqual(find_timestamps([10], [3600], time_delta), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -27,6 +27,7 @@ scraper_stack = ScraperCdkStack(
     "LeetcodeProgressScraperCdkStack",
     users_table=resource_stack.users_table,
     progress_table=resource_stack.progress_table,
+    backend_cache_bucket=resource_stack.backend_cache_bucket,
     env=env,
 )
 backend_stack = BackendCdkStack(
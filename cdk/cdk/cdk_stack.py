@@ -21,8 +21,8 @@ from aws_cdk import (
 )
 from constructs import Construct
 
-
 DOMAIN_NAME = "leetcode-progress.dasbd72.com"
+BACKEND_FUNCTION_NAME = "leetcode-progress-backend"
 USER_POOL_ARN = "arn:aws:cognito-idp:ap-northeast-1:718795813953:userpool/ap-northeast-1_MSLz0uAQD"
 
 DENY_CLOUDWATCH_LOGGING_POLICY_DOCUMENT = aws_iam.PolicyDocument(
@@ -202,6 +202,15 @@ class ResourceCdkStack(Stack):
             block_public_access=aws_s3.BlockPublicAccess.BLOCK_ALL,  # Recommended for private buckets
             removal_policy=RemovalPolicy.DESTROY,
             auto_delete_objects=True,
+            # Cache keys are versioned by data generation, so every scrape
+            # creates new objects. Nothing is served after CACHE_MAX_STALE
+            # (1 day), expire the older objects.
+            lifecycle_rules=[
+                aws_s3.LifecycleRule(
+                    id="ExpireCacheEntries",
+                    expiration=Duration.days(2),
+                )
+            ],
         )
 
         # Output the table names
@@ -242,6 +251,7 @@ class ScraperCdkStack(Stack):
         construct_id: str,
         users_table: aws_dynamodb.Table,
         progress_table: aws_dynamodb.Table,
+        backend_cache_bucket: aws_s3.Bucket,
         **kwargs,
     ) -> None:
         """
@@ -253,6 +263,7 @@ class ScraperCdkStack(Stack):
             construct_id (str): The logical ID of this stack.
             users_table (aws_dynamodb.Table): The DynamoDB table for user data.
             progress_table (aws_dynamodb.Table): The DynamoDB table for progress data.
+            backend_cache_bucket (aws_s3.Bucket): The S3 bucket used for caching, where the data generation is published.
             **kwargs: Additional stack properties.
         """
         super().__init__(scope, construct_id, **kwargs)
@@ -284,9 +295,23 @@ class ScraperCdkStack(Stack):
         users_table.grant_read_write_data(
             lambda_role
         )  # Grant read (Scan, Query, GetItem) access to users table
-        progress_table.grant_write_data(
+        progress_table.grant_read_write_data(
+            lambda_role
+        )  # Grant read (Query) and write (PutItem, BatchWriteItem, UpdateItem) access to progress table
+
+        backend_cache_bucket.grant_read_write(
             lambda_role
-        )  # Grant write (PutItem, BatchWriteItem, UpdateItem) access to progress table
+        )  # Grant access to publish the data generation marker
+
+        # Allow the scraper to invoke the backend to prewarm its cache
+        lambda_role.add_to_policy(
+            aws_iam.PolicyStatement(
+                actions=["lambda:InvokeFunction"],
+                resources=[
+                    f"arn:aws:lambda:{self.region}:{self.account}:function:{BACKEND_FUNCTION_NAME}"
+                ],
+            )
+        )
 
         scraper_layer = aws_lambda.LayerVersion(
             self,
@@ -325,6 +350,8 @@ class ScraperCdkStack(Stack):
             environment={
                 "USERS_TABLE_NAME": users_table.table_name,
                 "PROGRESS_TABLE_NAME": progress_table.table_name,
+                "BACKEND_FUNCTION_NAME": BACKEND_FUNCTION_NAME,
+                "CACHE_BUCKET_NAME": backend_cache_bucket.bucket_name,
             },
             role=lambda_role,
             layers=[scraper_layer],
@@ -442,7 +469,7 @@ class BackendCdkStack(Stack):
             aws_lambda.Function(  # Use standard aws_lambda.Function
                 self,
                 "LeetCodeProgressBackendFunction",
-                function_name="leetcode-progress-backend",
+                function_name=BACKEND_FUNCTION_NAME,
                 code=aws_lambda.Code.from_asset("../backend/app"),
                 handler="main.handler",
                 runtime=aws_lambda.Runtime.PYTHON_3_10,
@@ -0,0 +1,91 @@
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator
+
+SCAN_SEGMENTS = int(os.environ.get("SCAN_SEGMENTS", "4"))
+
+_SEGMENT_DONE = object()
+
+
+def scan_segment(
+    table,
+    segment: int | None = None,
+    total_segments: int | None = None,
+    **scan_kwargs,
+) -> Iterator[list[dict]]:
+    """Scans one segment of a table (or the whole table), yielding each page of items."""
+    if total_segments is not None:
+        scan_kwargs["Segment"] = segment
+        scan_kwargs["TotalSegments"] = total_segments
+    # The segments run in their own threads, which may share the client of
+    # the table but not the resource itself
+    client = table.meta.client
+    scan_kwargs["TableName"] = table.name
+    while True:
+        response = client.scan(**scan_kwargs)
+        yield response.get("Items", [])
+        if "LastEvaluatedKey" not in response:
+            break
+        scan_kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+
+def parallel_scan(
+    table, total_segments: int = SCAN_SEGMENTS, **scan_kwargs
+) -> Iterator[dict]:
+    """
+    Scans a table with DynamoDB parallel scan, one thread per segment, and
+    yields the items as their pages arrive. At most a few pages are buffered,
+    so the whole table is never held in memory by the scan itself.
+
+    Args:
+        table: The boto3 DynamoDB table resource.
+        total_segments (int): The number of segments scanned concurrently.
+        **scan_kwargs: Extra arguments of the scan, e.g. ProjectionExpression.
+    """
+    if total_segments <= 1:
+        for items in scan_segment(table, **scan_kwargs):
+            yield from items
+        return
+
+    pages = queue.Queue(maxsize=total_segments * 2)
+    stop = threading.Event()
+
+    def put(page) -> None:
+        while not stop.is_set():
+            try:
+                pages.put(page, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def scan(segment: int) -> None:
+        try:
+            for items in scan_segment(
+                table, segment, total_segments, **dict(scan_kwargs)
+            ):
+                if stop.is_set():
+                    return
+                put(items)
+        except Exception as e:
+            put(e)
+        finally:
+            put(_SEGMENT_DONE)
+
+    with ThreadPoolExecutor(max_workers=total_segments) as executor:
+        for segment in range(total_segments):
+            executor.submit(scan, segment)
+        try:
+            remaining = total_segments
+            while remaining:
+                page = pages.get()
+                if page is _SEGMENT_DONE:
+                    remaining -= 1
+                elif isinstance(page, Exception):
+                    raise page
+                else:
+                    yield from page
+        finally:
+            # Let the segments still running exit if the caller stops early
+            stop.set()
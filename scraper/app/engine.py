@@ -0,0 +1,389 @@
+import asyncio
+import os
+import random
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+
+import httpx
+from utils import (
+    GRAPHQL_URL,
+    HEADERS,
+    build_question_progress_batch_request,
+    build_question_progress_request,
+    parse_question_progress,
+)
+
+try:
+    import h2  # noqa: F401
+
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
+
+SCRAPE_CONCURRENCY = int(os.environ.get("SCRAPE_CONCURRENCY", "8"))
+# Requests per second sent to LeetCode, with bursts of up to SCRAPE_BURST
+SCRAPE_RATE = float(os.environ.get("SCRAPE_RATE", "10"))
+SCRAPE_BURST = int(os.environ.get("SCRAPE_BURST", "10"))
+SCRAPE_TIMEOUT = float(os.environ.get("SCRAPE_TIMEOUT", "10"))
+# Users fetched per GraphQL request, adapted between 1 and the maximum
+SCRAPE_BATCH_SIZE = int(os.environ.get("SCRAPE_BATCH_SIZE", "10"))
+SCRAPE_MAX_BATCH_SIZE = int(os.environ.get("SCRAPE_MAX_BATCH_SIZE", "50"))
+# Retries of throttled (429), failed (5xx) and timed out requests
+SCRAPE_MAX_RETRIES = int(os.environ.get("SCRAPE_MAX_RETRIES", "3"))
+SCRAPE_BACKOFF_BASE = 0.5
+SCRAPE_BACKOFF_MAX = float(os.environ.get("SCRAPE_BACKOFF_MAX", "10"))
+# The circuit opens when at least half of the last requests failed
+BREAKER_WINDOW = int(os.environ.get("SCRAPE_BREAKER_WINDOW", "20"))
+BREAKER_MIN_REQUESTS = int(os.environ.get("SCRAPE_BREAKER_MIN_REQUESTS", "10"))
+BREAKER_FAILURE_RATIO = float(
+    os.environ.get("SCRAPE_BREAKER_FAILURE_RATIO", "0.5")
+)
+BREAKER_COOLDOWN = float(os.environ.get("SCRAPE_BREAKER_COOLDOWN", "10"))
+
+
+class RetryableError(Exception):
+    """Upstream failure worth retrying, e.g. a 429 or a 5xx response."""
+
+    def __init__(self, message: str, retry_after: float | None = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of sending a request while the circuit is open."""
+
+
+class RetryBudgetError(Exception):
+    """Raised when waiting to retry a request would exceed the deadline."""
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Parses a Retry-After header, given in seconds or as an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    """
+    Stops sending requests upstream when the failure ratio of the last
+    `window` requests reaches `failure_ratio`. After `cooldown` seconds a
+    single trial request is let through: its success closes the circuit,
+    its failure opens it again.
+    """
+
+    def __init__(
+        self,
+        window: int = BREAKER_WINDOW,
+        min_requests: int = BREAKER_MIN_REQUESTS,
+        failure_ratio: float = BREAKER_FAILURE_RATIO,
+        cooldown: float = BREAKER_COOLDOWN,
+    ):
+        self.outcomes = deque(maxlen=window)
+        self.min_requests = min_requests
+        self.failure_ratio = failure_ratio
+        self.cooldown = cooldown
+        self.opened_at: float | None = None
+        self.trial_in_flight = False
+        self.open_count = 0
+        self.rejected_count = 0
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def before_request(self) -> None:
+        if self.opened_at is None:
+            return
+        if (
+            time.monotonic() - self.opened_at < self.cooldown
+            or self.trial_in_flight
+        ):
+            self.rejected_count += 1
+            raise CircuitOpenError("Circuit breaker is open")
+        self.trial_in_flight = True
+
+    def record(self, success: bool) -> None:
+        if self.opened_at is not None:
+            if not self.trial_in_flight:
+                return
+            self.trial_in_flight = False
+            if success:
+                self.opened_at = None
+                self.outcomes.clear()
+            else:
+                self.opened_at = time.monotonic()
+            return
+        self.outcomes.append(success)
+        failures = self.outcomes.count(False)
+        if len(
+            self.outcomes
+        ) >= self.min_requests and failures >= self.failure_ratio * len(
+            self.outcomes
+        ):
+            self.opened_at = time.monotonic()
+            self.open_count += 1
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter: `rate` tokens are added per second, up to
+    `capacity`, and each request takes one. Waiters are served in order.
+    """
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity,
+                    self.tokens + (now - self.updated_at) * self.rate,
+                )
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class ScraperEngine:
+    """
+    Fetches from the LeetCode GraphQL endpoint over one pooled HTTP client,
+    with at most `concurrency` requests in flight and a token bucket rate
+    limit. Use as an async context manager.
+    """
+
+    def __init__(
+        self,
+        url: str = GRAPHQL_URL,
+        concurrency: int = SCRAPE_CONCURRENCY,
+        rate: float = SCRAPE_RATE,
+        burst: int = SCRAPE_BURST,
+        timeout: float = SCRAPE_TIMEOUT,
+        batch_size: int = SCRAPE_BATCH_SIZE,
+        max_batch_size: int = SCRAPE_MAX_BATCH_SIZE,
+        max_retries: int = SCRAPE_MAX_RETRIES,
+        deadline: float | None = None,
+    ):
+        self.url = url
+        self.concurrency = concurrency
+        self.rate = rate
+        self.burst = burst
+        self.timeout = timeout
+        self.batch_size = max(1, min(batch_size, max_batch_size))
+        self.max_batch_size = max_batch_size
+        self.max_retries = max_retries
+        # time.monotonic() by which the scrape must be done, if any
+        self.deadline = deadline
+        self.breaker = CircuitBreaker()
+        self.stats = {"requests": 0, "retries": 0, "throttled": 0}
+        self.client: httpx.AsyncClient | None = None
+
+    async def __aenter__(self) -> "ScraperEngine":
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.bucket = TokenBucket(self.rate, self.burst)
+        self.client = httpx.AsyncClient(
+            http2=HTTP2,
+            headers=HEADERS,
+            timeout=httpx.Timeout(self.timeout),
+            limits=httpx.Limits(
+                max_connections=self.concurrency,
+                max_keepalive_connections=self.concurrency,
+            ),
+        )
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.client.aclose()
+
+    async def post(self, payload: dict, headers: dict) -> dict:
+        """
+        Sends a GraphQL request and returns its decoded JSON response.
+        Throttled (429), failed (5xx) and timed out requests are retried with
+        jittered exponential backoff, waiting for Retry-After when given.
+        A retry that cannot start before the deadline raises RetryBudgetError
+        instead, failing the request for this run.
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await self.send(payload, headers)
+            except RetryableError as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = random.uniform(
+                    0,
+                    min(SCRAPE_BACKOFF_MAX, SCRAPE_BACKOFF_BASE * 2**attempt),
+                )
+                if e.retry_after is not None:
+                    # Never retry sooner than the server asked
+                    delay = e.retry_after
+                if (
+                    self.deadline is not None
+                    and time.monotonic() + delay > self.deadline
+                ):
+                    raise RetryBudgetError(
+                        f"Retry in {delay:.1f}s would exceed the deadline: {e}"
+                    ) from e
+                self.stats["retries"] += 1
+                await asyncio.sleep(delay)
+
+    async def send(self, payload: dict, headers: dict) -> dict:
+        self.breaker.before_request()
+        async with self.semaphore:
+            await self.bucket.acquire()
+            self.stats["requests"] += 1
+            try:
+                response = await self.client.post(
+                    self.url, json=payload, headers=headers
+                )
+            except httpx.TransportError as e:
+                # Includes the timeouts
+                self.breaker.record(False)
+                raise RetryableError(f"{type(e).__name__}: {e}") from e
+        message = f"Query failed to run with status code {response.status_code}: {response.text}"
+        if response.status_code == 429 or response.status_code >= 500:
+            self.breaker.record(False)
+            if response.status_code == 429:
+                self.stats["throttled"] += 1
+            raise RetryableError(
+                message,
+                parse_retry_after(response.headers.get("Retry-After")),
+            )
+        self.breaker.record(True)
+        if response.status_code != 200:
+            raise Exception(message)
+        return response.json()
+
+    async def fetch_question_progress(self, user_slug: str) -> dict:
+        payload, headers = build_question_progress_request(user_slug)
+        data = await self.post(payload, headers)
+        return parse_question_progress(
+            data["data"]["userProfileUserQuestionProgressV2"]
+        )
+
+    async def fetch_question_progress_batch(
+        self, user_slugs: list[str]
+    ) -> dict[str, dict | Exception]:
+        """
+        Fetches the progress of several users with one aliased query. A user
+        whose selection failed gets an exception, without failing the others.
+        """
+        if len(user_slugs) == 1:
+            return {
+                user_slugs[0]: await self.fetch_question_progress(
+                    user_slugs[0]
+                )
+            }
+        payload, headers, aliases = build_question_progress_batch_request(
+            user_slugs
+        )
+        response = await self.post(payload, headers)
+        data = response.get("data") or {}
+        alias_errors = {}
+        for error in response.get("errors") or []:
+            path = error.get("path") or [None]
+            alias_errors.setdefault(path[0], error.get("message"))
+        outcomes = {}
+        for user_slug, alias in zip(user_slugs, aliases):
+            try:
+                if data.get(alias) is None:
+                    raise Exception(
+                        alias_errors.get(alias, "No progress returned")
+                    )
+                outcomes[user_slug] = parse_question_progress(data[alias])
+            except Exception as e:
+                outcomes[user_slug] = e
+        return outcomes
+
+    async def fetch_all_question_progress(
+        self, user_slugs: list[str]
+    ) -> tuple[dict, dict]:
+        """
+        Fetches the progress of every user in batches. The batch size grows
+        by one after each successful request and is halved when a request
+        fails, in which case the failed batch is split in two and retried,
+        down to single users.
+
+        Returns:
+            tuple: The progress of each user fetched successfully, and the
+                exception raised for each user that failed.
+        """
+        pending = deque(user_slugs)
+        # Halves of failed batches, retried before the pending users
+        retries = deque()
+        results = {}
+        failures = {}
+
+        async def worker():
+            while retries or pending:
+                if retries:
+                    batch = retries.popleft()
+                else:
+                    size = min(self.batch_size, len(pending))
+                    batch = [pending.popleft() for _ in range(size)]
+                try:
+                    outcomes = await self.fetch_question_progress_batch(batch)
+                except Exception as e:
+                    if len(batch) == 1 or isinstance(
+                        e, (CircuitOpenError, RetryBudgetError)
+                    ):
+                        for user_slug in batch:
+                            failures[user_slug] = e
+                        continue
+                    self.batch_size = max(1, len(batch) // 2)
+                    middle = len(batch) // 2
+                    retries.extend([batch[:middle], batch[middle:]])
+                    continue
+                self.batch_size = min(self.max_batch_size, self.batch_size + 1)
+                for user_slug, outcome in outcomes.items():
+                    if isinstance(outcome, Exception):
+                        failures[user_slug] = outcome
+                    else:
+                        results[user_slug] = outcome
+
+        await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        return results, failures
+
+    def get_stats(self) -> dict:
+        """Returns the request, retry and circuit breaker counters."""
+        return {
+            **self.stats,
+            "breaker_opened": self.breaker.open_count,
+            "breaker_rejected": self.breaker.rejected_count,
+        }
+
+
+def scrape_question_progress(
+    user_slugs: list[str], **engine_kwargs
+) -> tuple[dict, dict, dict]:
+    """
+    Fetches the progress of every user, see `ScraperEngine`.
+
+    Returns:
+        tuple: The progress of each user fetched successfully, the exception
+            raised for each user that failed and the engine counters.
+    """
+
+    async def scrape() -> tuple[dict, dict, dict]:
+        async with ScraperEngine(**engine_kwargs) as engine:
+            results, failures = await engine.fetch_all_question_progress(
+                user_slugs
+            )
+            return results, failures, engine.get_stats()
+
+    return asyncio.run(scrape())
@@ -1,18 +1,308 @@
+import json
 import os
+import random
+import time
+import urllib.parse
 from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 from time import perf_counter
 
 import boto3
-from utils import fetch_question_progress
+from boto3.dynamodb.conditions import Key
+from dynamo import parallel_scan
+from engine import scrape_question_progress
 
 USERS_TABLE_NAME = os.environ.get("USERS_TABLE_NAME")
 PROGRESS_TABLE_NAME = os.environ.get("PROGRESS_TABLE_NAME")
+BACKEND_FUNCTION_NAME = os.environ.get("BACKEND_FUNCTION_NAME")
+CACHE_BUCKET_NAME = os.environ.get("CACHE_BUCKET_NAME")
+# Encoded the same way as the backend cache keys
+GENERATION_KEY = urllib.parse.quote_plus("progress:generation", safe="")
+
+# Rollups keep the first sample of each user in every UTC hour and day,
+# stored in the progress table under "rollup#<granularity>#<username>"
+ROLLUP_GRANULARITIES = {"hourly": 3600, "daily": 86400}
+
+# With delta writes, a sample is only stored when the progress of the user
+# changed, or as a heartbeat when the last stored one is HEARTBEAT_INTERVAL
+# old. Readers carry the previous sample over to the scrapes in between,
+# whose timestamps are stored under SCRAPE_CLOCK_KEY, together with the
+# users whose progress could not be fetched.
+DELTA_WRITES = os.environ.get("DELTA_WRITES", "false").lower() == "true"
+HEARTBEAT_INTERVAL = int(os.environ.get("HEARTBEAT_INTERVAL", "86400"))
+SCRAPE_CLOCK_KEY = "scrape#clock"
+
+# Progress views the backend recomputes after each scrape, as "hours:limit"
+# pairs, each in every timezone of PREWARM_TIMEZONES
+PREWARM_VIEWS = os.environ.get("PREWARM_VIEWS", "1:48,24:24").split(",")
+PREWARM_TIMEZONES = os.environ.get(
+    "PREWARM_TIMEZONES", "UTC,Asia/Taipei"
+).split(",")
+
+# Seconds of the Lambda timeout kept to store the results after fetching
+# them; throttled requests are not retried past it
+SCRAPE_TIME_RESERVE = float(os.environ.get("SCRAPE_TIME_RESERVE", "15"))
+
+# Concurrent updates of the users' latest_* attributes
+UPDATE_CONCURRENCY = int(os.environ.get("UPDATE_CONCURRENCY", "8"))
+UPDATE_MAX_RETRIES = int(os.environ.get("UPDATE_MAX_RETRIES", "5"))
+UPDATE_BACKOFF_BASE = 0.05
+UPDATE_BACKOFF_MAX = 2.0
+THROTTLING_ERROR_CODES = {
+    "ProvisionedThroughputExceededException",
+    "ThrottlingException",
+    "RequestLimitExceeded",
+}
 
 # DynamoDB setup
 dynamodb = boto3.resource("dynamodb")
 progress_table = dynamodb.Table(PROGRESS_TABLE_NAME)
 users_table = dynamodb.Table(USERS_TABLE_NAME)
+# Resources are not thread-safe, the concurrent updates share this client
+dynamodb_client = dynamodb.meta.client
+lambda_client = boto3.client("lambda")
+s3 = boto3.client("s3")
+
+
+def publish_generation(timestamp: int) -> dict | None:
+    """
+    Publishes the data generation marker that the backend ties its cache
+    keys to, so that cached progress stays valid until the next scrape.
+    """
+    if not CACHE_BUCKET_NAME:
+        return None
+    previous = None
+    try:
+        response = s3.get_object(Bucket=CACHE_BUCKET_NAME, Key=GENERATION_KEY)
+        previous = json.loads(response["Body"].read())["generation"]
+    except s3.exceptions.NoSuchKey:
+        pass
+    marker = {"generation": timestamp, "previous": previous}
+    s3.put_object(
+        Bucket=CACHE_BUCKET_NAME,
+        Key=GENERATION_KEY,
+        Body=json.dumps(marker),
+        ContentType="application/json",
+    )
+    return marker
+
+
+def scan_users() -> list[dict]:
+    """Scans the users table, projecting only the attributes the scraper uses."""
+    return list(
+        parallel_scan(
+            users_table,
+            ProjectionExpression="username, leetcode_username, first_timestamp, latest_timestamp, latest_sample_timestamp, latest_easy, latest_medium, latest_hard, latest_total",
+        )
+    )
+
+
+def fetch_previous_scrape(timestamp: int) -> dict | None:
+    """
+    Fetches the clock item of the last scrape before `timestamp`, holding
+    its timestamp and the users it failed to fetch.
+    """
+    response = progress_table.query(
+        KeyConditionExpression=Key("username").eq(SCRAPE_CLOCK_KEY)
+        & Key("timestamp").lt(timestamp),
+        ProjectionExpression="#ts, failed",
+        ExpressionAttributeNames={"#ts": "timestamp"},
+        ScanIndexForward=False,
+        Limit=1,
+    )
+    items = response.get("Items", [])
+    if not items:
+        return None
+    return {
+        "timestamp": int(items[0]["timestamp"]),
+        "failed": set(items[0].get("failed", [])),
+    }
+
+
+def fetch_first_timestamp(leetcode_username: str) -> int | None:
+    """Fetches the timestamp of the first stored sample of a user."""
+    response = dynamodb_client.query(
+        TableName=PROGRESS_TABLE_NAME,
+        KeyConditionExpression=Key("username").eq(leetcode_username),
+        ProjectionExpression="#ts",
+        ExpressionAttributeNames={"#ts": "timestamp"},
+        ScanIndexForward=True,
+        Limit=1,
+    )
+    items = response.get("Items", [])
+    if items:
+        return int(items[0]["timestamp"])
+    return None
+
+
+def has_latest_stats(user_item: dict, stats: dict) -> bool:
+    """Tells whether the latest_* attributes of the user hold these stats."""
+    return all(
+        int(user_item.get(f"latest_{field}", -1)) == stats.get(key, 0)
+        for field, key in (
+            ("easy", "EASY"),
+            ("medium", "MEDIUM"),
+            ("hard", "HARD"),
+            ("total", "TOTAL"),
+        )
+    )
+
+
+def is_sample_due(user_item: dict, stats: dict, timestamp: int) -> bool:
+    """
+    Tells whether a sample of the user must be stored in delta-write mode,
+    i.e. the progress differs from the latest one or the heartbeat is due.
+    """
+    if not DELTA_WRITES or "latest_sample_timestamp" not in user_item:
+        return True
+    if timestamp - int(user_item["latest_sample_timestamp"]) >= (
+        HEARTBEAT_INTERVAL
+    ):
+        return True
+    return not has_latest_stats(user_item, stats)
+
+
+def update_user_latest(
+    user_item: dict,
+    stats: dict,
+    timestamp: int,
+    sample_written: bool,
+    sample_due: bool,
+) -> bool:
+    """
+    Stores the latest stats of a user on their users item, retrying throttled
+    writes with jittered exponential backoff.
+
+    The update is skipped when the stats are unchanged, so latest_timestamp
+    is the time of the last change.
+
+    Returns:
+        bool: Whether the item was updated.
+    """
+    if (
+        "first_timestamp" in user_item
+        and has_latest_stats(user_item, stats)
+        and not (DELTA_WRITES and sample_due)
+    ):
+        return False
+
+    # Users scraped before first_timestamp was stored get it from
+    # their first sample, once
+    first_timestamp = user_item.get("first_timestamp")
+    if first_timestamp is None:
+        first_timestamp = (
+            fetch_first_timestamp(user_item["leetcode_username"]) or timestamp
+        )
+    update_expression = "SET latest_timestamp = :ts, latest_easy = :e, latest_medium = :m, latest_hard = :h, latest_total = :t, first_timestamp = if_not_exists(first_timestamp, :first)"
+    if DELTA_WRITES and sample_written:
+        update_expression += ", latest_sample_timestamp = :ts"
+    elif DELTA_WRITES and sample_due:
+        # The sample could not be written, store it on the next run
+        update_expression += " REMOVE latest_sample_timestamp"
+
+    for retries in range(UPDATE_MAX_RETRIES + 1):
+        try:
+            dynamodb_client.update_item(
+                TableName=USERS_TABLE_NAME,
+                Key={"username": user_item["username"]},
+                UpdateExpression=update_expression,
+                ExpressionAttributeValues={
+                    ":ts": timestamp,
+                    ":first": first_timestamp,
+                    ":e": stats.get("EASY", 0),
+                    ":m": stats.get("MEDIUM", 0),
+                    ":h": stats.get("HARD", 0),
+                    ":t": stats.get("TOTAL", 0),
+                },
+            )
+            return True
+        except dynamodb_client.exceptions.ClientError as e:
+            code = e.response.get("Error", {}).get("Code")
+            if (
+                code not in THROTTLING_ERROR_CODES
+                or retries == UPDATE_MAX_RETRIES
+            ):
+                raise
+            time.sleep(
+                random.uniform(
+                    0,
+                    min(
+                        UPDATE_BACKOFF_MAX,
+                        UPDATE_BACKOFF_BASE * 2**retries,
+                    ),
+                )
+            )
+
+
+def build_rollup_items(
+    leetcode_username: str,
+    stats: dict,
+    timestamp: int,
+    previous_timestamp: int,
+) -> list[dict]:
+    """
+    Builds the rollup items of a sample that is the first one of the user in
+    its hour or day, given the timestamp of the user's previous sample, e.g.
+    the previous scrape.
+    """
+    items = []
+    for granularity, seconds in ROLLUP_GRANULARITIES.items():
+        bucket_start = timestamp - timestamp % seconds
+        if previous_timestamp >= bucket_start:
+            continue
+        items.append(
+            {
+                "username": f"rollup#{granularity}#{leetcode_username}",
+                "timestamp": bucket_start,
+                "sample_timestamp": timestamp,
+                "easy": stats.get("EASY", 0),
+                "medium": stats.get("MEDIUM", 0),
+                "hard": stats.get("HARD", 0),
+                "total": stats.get("TOTAL", 0),
+            }
+        )
+    return items
+
+
+def put_rollup_items_if_absent(items: list[dict]) -> int:
+    """
+    Writes the rollup items whose bucket has no rollup yet, for the users
+    whose previous sample is unknown. Returns the number of items written.
+    """
+    written = 0
+    for item in items:
+        try:
+            progress_table.put_item(
+                Item=item,
+                ConditionExpression="attribute_not_exists(username)",
+            )
+            written += 1
+        except dynamodb_client.exceptions.ConditionalCheckFailedException:
+            pass
+    return written
+
+
+def prewarm_backend_cache(generation: dict | None) -> None:
+    """
+    Asks the backend to recompute the popular cached progress views, with
+    one asynchronous invocation per view so that a slow view neither times
+    out the others nor has them recomputed when it is retried.
+    """
+    if not BACKEND_FUNCTION_NAME:
+        return
+    views = ["latest"] + [
+        f"{view}:{timezone_str}"
+        for view in PREWARM_VIEWS
+        for timezone_str in PREWARM_TIMEZONES
+    ]
+    for view in views:
+        lambda_client.invoke(
+            FunctionName=BACKEND_FUNCTION_NAME,
+            InvocationType="Event",
+            Payload=json.dumps(
+                {"action": "prewarm", "generation": generation, "view": view}
+            ),
+        )
 
 
 def lambda_handler(event, context):
@@ -24,99 +314,199 @@ def lambda_handler(event, context):
         "get_users": 0,
         "fetch_progress": 0,
         "put_progress": 0,
+        "skipped_progress": 0,
+        "conditional_rollups": 0,
         "update_user_latest": 0,
+        "skipped_user_latest": 0,
+        "publish_generation": 0,
+        "prewarm_cache": 0,
     }
     errors = []
 
     # Fetch all usernames and slugs from LeetCodeProgressUsers
     start_perf = perf_counter()
-    users_response = users_table.scan()
-    user_items = users_response.get("Items", [])
+    user_items = [item for item in scan_users() if "leetcode_username" in item]
     leetcode_usernames = list(
         set(user["leetcode_username"] for user in user_items)
     )
+    # Users fetched by the previous scrape have a sample at its timestamp,
+    # which tells whether this one starts a new rollup bucket for them
+    previous_scrape = fetch_previous_scrape(timestamp)
+    previously_fetched = set()
+    if previous_scrape is not None:
+        previously_fetched = (
+            set(
+                user["leetcode_username"]
+                for user in user_items
+                if int(user.get("first_timestamp", timestamp))
+                <= previous_scrape["timestamp"]
+            )
+            - previous_scrape["failed"]
+        )
     performance["get_users"] = perf_counter() - start_perf
 
     # Fetch progress for each user
     start_perf = perf_counter()
-    with ThreadPoolExecutor() as executor:
+    deadline = None
+    if context is not None:
+        deadline = (
+            time.monotonic()
+            + context.get_remaining_time_in_millis() / 1000
+            - SCRAPE_TIME_RESERVE
+        )
+    result, failures, fetch_stats = scrape_question_progress(
+        leetcode_usernames, deadline=deadline
+    )
+    fetch_count = len(result)
+    for name, count in fetch_stats.items():
+        performance[f"fetch_{name}"] = count
+    if fetch_stats["breaker_opened"]:
+        errors.append(
+            {
+                "operation": "fetch_progress",
+                "error": f"Circuit breaker opened {fetch_stats['breaker_opened']} times, rejecting {fetch_stats['breaker_rejected']} requests",
+            }
+        )
+    for leetcode_username, e in failures.items():
+        print(f"Failed to fetch progress for {leetcode_username}: {e}")
+        errors.append(
+            {
+                "operation": "fetch_progress",
+                "username": leetcode_username,
+                "error": str(e),
+            }
+        )
+    performance["fetch_progress"] = perf_counter() - start_perf
+
+    # Batch write results to LeetCodeProgress-s8nczw
+    start_perf = perf_counter()
+    due_usernames = set(
+        user["leetcode_username"]
+        for user in user_items
+        if user["leetcode_username"] in result
+        and is_sample_due(user, result[user["leetcode_username"]], timestamp)
+    )
+    written_usernames = set()
+    # Rollups of users missed by the previous scrape, written only if their
+    # bucket has none yet
+    conditional_rollup_items = []
+    try:
+        with progress_table.batch_writer() as batch:
+            for leetcode_username, stats in result.items():
+                if leetcode_username in due_usernames:
+                    batch.put_item(
+                        Item={
+                            "username": leetcode_username,
+                            "timestamp": timestamp,
+                            "easy": stats.get("EASY", 0),
+                            "medium": stats.get("MEDIUM", 0),
+                            "hard": stats.get("HARD", 0),
+                            "total": stats.get("TOTAL", 0),
+                        }
+                    )
+                else:
+                    performance["skipped_progress"] += 1
+                if leetcode_username in previously_fetched:
+                    for item in build_rollup_items(
+                        leetcode_username,
+                        stats,
+                        timestamp,
+                        previous_scrape["timestamp"],
+                    ):
+                        batch.put_item(Item=item)
+                else:
+                    conditional_rollup_items.extend(
+                        build_rollup_items(
+                            leetcode_username, stats, timestamp, 0
+                        )
+                    )
+            # Written last, so that readers never see a scrape whose
+            # samples are not stored yet
+            if result:
+                clock_item = {
+                    "username": SCRAPE_CLOCK_KEY,
+                    "timestamp": timestamp,
+                }
+                if failures:
+                    clock_item["failed"] = sorted(failures)
+                batch.put_item(Item=clock_item)
+        written_usernames = due_usernames
+        performance["conditional_rollups"] = put_rollup_items_if_absent(
+            conditional_rollup_items
+        )
+    except Exception as e:
+        print(f"Error writing progress to LeetCodeProgress: {e}")
+        errors.append(
+            {
+                "operation": "put_progress",
+                "error": str(e),
+            }
+        )
+    performance["put_progress"] = perf_counter() - start_perf
+
+    # Update latest progress in users_table, concurrently
+    start_perf = perf_counter()
+    with ThreadPoolExecutor(max_workers=UPDATE_CONCURRENCY) as executor:
         futures = {
-            leetcode_username: executor.submit(
-                fetch_question_progress, leetcode_username
+            user_item["username"]: executor.submit(
+                update_user_latest,
+                user_item,
+                result[user_item["leetcode_username"]],
+                timestamp,
+                sample_written=user_item["leetcode_username"]
+                in written_usernames,
+                sample_due=user_item["leetcode_username"] in due_usernames,
             )
-            for leetcode_username in leetcode_usernames
+            for user_item in user_items
+            if user_item["leetcode_username"] in result
         }
-        for leetcode_username in futures:
+        for username, future in futures.items():
             try:
-                result[leetcode_username] = futures[leetcode_username].result()
-                fetch_count += 1
+                if future.result():
+                    update_count += 1
+                else:
+                    performance["skipped_user_latest"] += 1
             except Exception as e:
-                print(f"Failed to fetch progress for {leetcode_username}: {e}")
+                print(
+                    f"Error updating latest progress for user {username}: {e}"
+                )
                 errors.append(
                     {
-                        "operation": "fetch_progress",
-                        "username": leetcode_username,
+                        "operation": "update_user_latest",
+                        "username": username,
                         "error": str(e),
                     }
                 )
-    performance["fetch_progress"] = perf_counter() - start_perf
+    performance["update_user_latest"] = perf_counter() - start_perf
 
-    # Batch write results to LeetCodeProgress-s8nczw
+    # Start a new data generation, invalidating the backend cache
     start_perf = perf_counter()
+    generation = None
     try:
-        with progress_table.batch_writer() as batch:
-            for leetcode_username, stats in result.items():
-                batch.put_item(
-                    Item={
-                        "username": leetcode_username,
-                        "timestamp": timestamp,
-                        "easy": stats.get("EASY", 0),
-                        "medium": stats.get("MEDIUM", 0),
-                        "hard": stats.get("HARD", 0),
-                        "total": stats.get("TOTAL", 0),
-                    }
-                )
+        generation = publish_generation(timestamp)
     except Exception as e:
-        print(f"Error writing progress to LeetCodeProgress: {e}")
+        print(f"Error publishing data generation: {e}")
         errors.append(
             {
-                "operation": "put_progress",
+                "operation": "publish_generation",
                 "error": str(e),
             }
         )
-    performance["put_progress"] = perf_counter() - start_perf
+    performance["publish_generation"] = perf_counter() - start_perf
 
-    # Update latest progress in users_table (individual updates)
+    # Prewarm the backend cache now that the data is stored
     start_perf = perf_counter()
-    for user_item in user_items:
-        username = user_item["username"]
-        leetcode_username = user_item["leetcode_username"]
-        if not leetcode_username in result:
-            continue
-        stats = result[leetcode_username]
-        try:
-            users_table.update_item(
-                Key={"username": username},
-                UpdateExpression="SET latest_timestamp = :ts, latest_easy = :e, latest_medium = :m, latest_hard = :h, latest_total = :t",
-                ExpressionAttributeValues={
-                    ":ts": timestamp,
-                    ":e": stats.get("EASY", 0),
-                    ":m": stats.get("MEDIUM", 0),
-                    ":h": stats.get("HARD", 0),
-                    ":t": stats.get("TOTAL", 0),
-                },
-            )
-            update_count += 1
-        except Exception as e:
-            print(f"Error updating latest progress for user {username}: {e}")
-            errors.append(
-                {
-                    "operation": "update_user_latest",
-                    "username": username,
-                    "error": str(e),
-                }
-            )
-    performance["update_user_latest"] = perf_counter() - start_perf
+    try:
+        prewarm_backend_cache(generation)
+    except Exception as e:
+        print(f"Error prewarming backend cache: {e}")
+        errors.append(
+            {
+                "operation": "prewarm_cache",
+                "error": str(e),
+            }
+        )
+    performance["prewarm_cache"] = perf_counter() - start_perf
 
     return {
         "statusCode": 200,
@@ -1,22 +1,15 @@
-import requests
+import os
 
-GRAPHQL_URL = "https://leetcode.com/graphql"
+GRAPHQL_URL = os.environ.get(
+    "LEETCODE_GRAPHQL_URL", "https://leetcode.com/graphql"
+)
 HEADERS = {
     "Content-Type": "application/json",
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3",
     "Referer": "https://leetcode.com/problemset/all/",
 }
 
-
-def fetch_question_progress(user_slug: str):
-    headers = HEADERS.copy()
-    headers.update(
-        {
-            "Referer": f"https://leetcode.com/{user_slug}/",
-        }
-    )
-
-    query = """
+QUESTION_PROGRESS_QUERY = """
     query userProfileUserQuestionProgressV2($userSlug: String!) {
       userProfileUserQuestionProgressV2(userSlug: $userSlug) {
         numAcceptedQuestions {
@@ -26,32 +19,72 @@ def fetch_question_progress(user_slug: str):
       }
     }
     """
+
+QUESTION_PROGRESS_BATCH_QUERY = """
+    query userProfileUserQuestionProgressV2Batch({variables}) {{{selections}
+    }}
+    """
+QUESTION_PROGRESS_SELECTION = """
+      {alias}: userProfileUserQuestionProgressV2(userSlug: ${variable}) {{
+        numAcceptedQuestions {{
+          count
+          difficulty
+        }}
+      }}"""
+
+
+def build_question_progress_request(user_slug: str) -> tuple[dict, dict]:
+    """Returns the GraphQL payload and the headers to fetch a user's progress."""
+    headers = HEADERS.copy()
+    headers.update(
+        {
+            "Referer": f"https://leetcode.com/{user_slug}/",
+        }
+    )
     payload = {
-        "query": query,
+        "query": QUESTION_PROGRESS_QUERY,
         "variables": {"userSlug": user_slug},
         "operationName": "userProfileUserQuestionProgressV2",
     }
-    response = requests.post(GRAPHQL_URL, json=payload, headers=headers)
-
-    if response.status_code == 200:
-        data = response.json()
-        data = data["data"]["userProfileUserQuestionProgressV2"][
-            "numAcceptedQuestions"
-        ]
-        response = {
-            "EASY": 0,
-            "MEDIUM": 0,
-            "HARD": 0,
-            "TOTAL": 0,
-        }
-        for entry in data:
-            difficulty: str = entry["difficulty"]
-            count: int = entry["count"]
-            assert difficulty in response
-            response[difficulty] = count
-            response["TOTAL"] += count
-        return response
-    else:
-        raise Exception(
-            f"Query failed to run with status code {response.status_code}: {response.text}"
-        )
+    return payload, headers
+
+
+def build_question_progress_batch_request(
+    user_slugs: list[str],
+) -> tuple[dict, dict, list[str]]:
+    """
+    Returns the GraphQL payload and the headers to fetch the progress of
+    several users in one request, each selection aliased as `u<index>`,
+    together with the aliases in the order of `user_slugs`.
+    """
+    aliases = [f"u{i}" for i in range(len(user_slugs))]
+    query = QUESTION_PROGRESS_BATCH_QUERY.format(
+        variables=", ".join(f"$s{i}: String!" for i in range(len(aliases))),
+        selections="".join(
+            QUESTION_PROGRESS_SELECTION.format(alias=alias, variable=f"s{i}")
+            for i, alias in enumerate(aliases)
+        ),
+    )
+    payload = {
+        "query": query,
+        "variables": {f"s{i}": slug for i, slug in enumerate(user_slugs)},
+        "operationName": "userProfileUserQuestionProgressV2Batch",
+    }
+    return payload, HEADERS.copy(), aliases
+
+
+def parse_question_progress(data: dict) -> dict:
+    """Counts the accepted questions of a `userProfileUserQuestionProgressV2`."""
+    response = {
+        "EASY": 0,
+        "MEDIUM": 0,
+        "HARD": 0,
+        "TOTAL": 0,
+    }
+    for entry in data["numAcceptedQuestions"]:
+        difficulty: str = entry["difficulty"]
+        count: int = entry["count"]
+        assert difficulty in response
+        response[difficulty] = count
+        response["TOTAL"] += count
+    return response
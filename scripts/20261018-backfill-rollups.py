@@ -0,0 +1,53 @@
+import boto3
+
+ROLLUP_GRANULARITIES = {"hourly": 3600, "daily": 86400}
+
+
+def backfill_rollups(progress_table_name):
+    dynamodb = boto3.resource("dynamodb")
+    progress_table = dynamodb.Table(progress_table_name)
+
+    # Scan the progress table
+    response = progress_table.scan()
+    items = response["Items"]
+
+    # Paginate through all items if the table is large
+    while "LastEvaluatedKey" in response:
+        response = progress_table.scan(
+            ExclusiveStartKey=response["LastEvaluatedKey"]
+        )
+        items.extend(response["Items"])
+
+    # Keep the first sample of each user in every hour and day
+    rollups = {}
+    for item in sorted(items, key=lambda item: int(item["timestamp"])):
+        if "#" in item["username"]:
+            continue
+        timestamp = int(item["timestamp"])
+        for granularity, seconds in ROLLUP_GRANULARITIES.items():
+            username = f"rollup#{granularity}#{item['username']}"
+            bucket_start = timestamp - timestamp % seconds
+            if (username, bucket_start) in rollups:
+                continue
+            rollups[(username, bucket_start)] = {
+                "username": username,
+                "timestamp": bucket_start,
+                "sample_timestamp": timestamp,
+                "easy": item.get("easy", 0),
+                "medium": item.get("medium", 0),
+                "hard": item.get("hard", 0),
+                "total": item.get("total", 0),
+            }
+
+    # Write each rollup item to the progress table
+    with progress_table.batch_writer() as batch:
+        for item in rollups.values():
+            batch.put_item(Item=item)
+
+    print(
+        f"Successfully wrote {len(rollups)} rollup items from {len(items)} items to {progress_table_name}"
+    )
+
+
+if __name__ == "__main__":
+    backfill_rollups("LeetCodeProgressData-1746776519")